@@ -1,24 +1,35 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response
+from flask import Flask, Blueprint, current_app, render_template, request, redirect, url_for, flash, jsonify, Response, send_file, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+from flask_caching import Cache
+from flask.cli import with_appcontext
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
-from sqlalchemy import or_, func
-from weasyprint import HTML
+from sqlalchemy import func
 import calendar
-import pandas as pd
+import csv
+import hashlib
+import io
+import json
+import tempfile
+import time
+import zipfile
+import click
+from concurrent.futures import ProcessPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+from functools import wraps
+import sqlite3
+from db_routing import REPLICA_BIND, RoutingSession, engine_options, use_replica
 
 # --- App and Database Configuration ---
+# Extensions are bound to the app in create_app(); heavy libraries (WeasyPrint) load on first use
 basedir = os.path.abspath(os.path.dirname(__file__))
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a_very_secret_key_that_should_be_changed_in_production')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(basedir, "database.db")}')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
-login_manager = LoginManager(app)
+# Reads in views marked @read_replica go to the replica bind when DATABASE_REPLICA_URL is set
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+cache = Cache()
+login_manager = LoginManager()
 # ## MODIFIED ## - The new login portal page
-login_manager.login_view = 'login'
+login_manager.login_view = 'auth.login'
 
 # --- Database Models ---
 class User(db.Model, UserMixin):
@@ -36,9 +47,17 @@ class User(db.Model, UserMixin):
     employees = db.relationship('User', backref=db.backref('supervisor', remote_side=[id]), lazy='dynamic')
     leave_requests = db.relationship('LeaveRequest', backref='employee', lazy='dynamic')
     announcements = db.relationship('Announcement', backref='author', lazy='dynamic')
+    __table_args__ = (db.Index('ix_user_name_id', 'name', 'id'),)
     def set_password(self, password): self.password_hash = generate_password_hash(password)
     def check_password(self, password): return check_password_hash(self.password_hash, password)
 
+class UserHierarchy(db.Model):
+    # Closure table over User.supervisor_id, maintained by org_hierarchy
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)
+    __table_args__ = (db.Index('ix_user_hierarchy_descendant_depth', 'descendant_id', 'depth'),)
+
 class LeaveRequest(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -51,6 +70,10 @@ class LeaveRequest(db.Model):
     team_leader_name = db.Column(db.String(100))
     team_leader_mobile = db.Column(db.String(20))
     leave_type = db.Column(db.String(50), nullable=False, default='Other')
+    __table_args__ = (
+        db.Index('ix_leave_request_user_status_dates', 'user_id', 'status', 'start_date', 'end_date'),
+        db.Index('ix_leave_request_status_dates', 'status', 'start_date', 'end_date'),
+    )
 
 class Holiday(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -63,66 +86,159 @@ class PersonalTask(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
     task_description = db.Column(db.Text, nullable=False)
+    __table_args__ = (db.Index('ix_personal_task_user_date', 'user_id', 'date'),)
 
 class Announcement(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+class PayslipSnapshot(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    gross_salary = db.Column(db.Float, nullable=False)
+    total_payable_days = db.Column(db.Integer, nullable=False)
+    per_day_salary = db.Column(db.Float, nullable=False)
+    deductible_leave_days = db.Column(db.Integer, nullable=False)
+    deductions = db.Column(db.Float, nullable=False)
+    net_salary = db.Column(db.Float, nullable=False)
+    __table_args__ = (db.UniqueConstraint('user_id', 'year', 'month'),)
+
+class DataVersion(db.Model):
+    # One counter per kind of data; bumped in the same transaction as the change so caches in every worker can tell they are stale
+    key = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+DATA_VERSION_KEYS = ['holidays', 'leaves', 'tasks', 'users']
+
+def get_data_version(key):
+    row = db.session.get(DataVersion, key)
+    return row.version if row else 0
+
+def get_data_versions(*keys):
+    # One query for several counters; later get_data_version() calls in the request hit the identity map
+    rows = {row.key: row for row in DataVersion.query.filter(DataVersion.key.in_(keys)).all()}
+    return {key: rows[key].version if key in rows else 0 for key in keys}, max((row.updated_at for row in rows.values() if row.updated_at), default=None)
+
+def bump_data_version(*keys):
+    for key in keys:
+        if not DataVersion.query.filter_by(key=key).update({DataVersion.version: DataVersion.version + 1, DataVersion.updated_at: datetime.utcnow()}):
+            db.session.add(DataVersion(key=key, version=1, updated_at=datetime.utcnow()))
     
-from payroll import calculate_payslip
+from payroll import calculate_payslip, calculate_payroll_batch, get_payslips, invalidate_payslips, invalidate_payslips_for_leaves
+from workcalendar import WorkingDayCalendarService
+from leave_index import LeaveIndexService
+from pdf_renderer import PdfRenderer, render_pdf_file
+from employee_import import IMPORT_COLUMNS, import_employees, read_import_csv
+from identity import PrincipalCache, principal_data
+from employee_search import keyset_page, search_filter, setup_search_index
+import org_hierarchy
+from forecast import DEFAULT_MONTHS as FORECAST_MONTHS, MAX_MONTHS as FORECAST_MAX_MONTHS, payroll_forecast
+from instrumentation import RequestMetrics
+
+def load_principal_data(user_id):
+    user = db.session.get(User, user_id)
+    if user is None: return None
+    return principal_data(user, [row[0] for row in db.session.execute(org_hierarchy.descendants_query(db, UserHierarchy, user_id)).all()])
+
+def load_approved_leaves():
+    return db.session.query(LeaveRequest.id, LeaveRequest.user_id, LeaveRequest.start_date, LeaveRequest.end_date).filter_by(status='Approved').all()
+
+def load_holidays(): return [(h.date, h.name, h.type) for h in Holiday.query.all()]
+
+def refresh_leave_index(approved=(), removed=(), removed_users=()):
+    # Call after committing a change that bumped the 'leaves' version; approved holds (id, user_id, start_date, end_date)
+    def change(index):
+        for leave_id in removed: index.remove(leave_id)
+        for user_id in removed_users: index.remove_user(user_id)
+        for leave in approved: index.add(*leave)
+    current_app.extensions['leave_index'].apply(get_data_version('leaves'), change)
+
+def upgrade_schema():
+    # Lightweight migration: create missing tables, then any indexes added to existing tables since they were created
+    db.create_all()
+    inspector = db.inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                db.session.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=db.engine.dialect)}'))
+        for index in table.indexes: index.create(db.engine, checkfirst=True)
+    setup_search_index(db)
+    org_hierarchy.rebuild_hierarchy(db, User, UserHierarchy)
+    for key in DATA_VERSION_KEYS:
+        if not db.session.get(DataVersion, key): db.session.add(DataVersion(key=key, version=0))
+    db.session.commit()
 MAIN_SUPERVISOR_ID = 'MAIN_SUPERVISOR'
 
+auth_bp = Blueprint('auth', __name__)
+main_bp = Blueprint('main', __name__)
+employees_bp = Blueprint('employees', __name__)
+leave_bp = Blueprint('leave', __name__)
+payroll_bp = Blueprint('payroll', __name__)
+admin_bp = Blueprint('admin', __name__)
+
+def read_replica(view):
+    # Report and analytics views read from the replica; anything they write still goes to the primary
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        use_replica(); return view(*args, **kwargs)
+    return wrapper
+
 
 
 # --- All Routes and Functions ---
 @login_manager.user_loader
-def load_user(user_id): return User.query.get(int(user_id))
+def load_user(user_id): return current_app.extensions['principals'].get(int(user_id))
 
-@app.route('/')
+@auth_bp.route('/')
 def index(): return render_template('index.html')
 
 # ## NEW ## - Login Routes for each role
-@app.route('/login', methods=['GET'])
+@auth_bp.route('/login', methods=['GET'])
 def login():
-    if current_user.is_authenticated: return redirect(url_for('dashboard'))
+    if current_user.is_authenticated: return redirect(url_for('main.dashboard'))
     return render_template('login_selection.html')
 
 def handle_login(role):
-    if current_user.is_authenticated: return redirect(url_for('dashboard'))
+    if current_user.is_authenticated: return redirect(url_for('main.dashboard'))
     if request.method == 'POST':
         user = User.query.filter_by(employee_id=request.form['employee_id'], role=role).first()
         if user and user.check_password(request.form['password']):
-            login_user(user); return redirect(url_for('dashboard'))
+            login_user(user); return redirect(url_for('main.dashboard'))
         else: flash(f'Invalid ID or password for {role}.', 'error')
     template = f'login_{role}.html'
     return render_template(template)
 
-@app.route('/login/employee', methods=['GET', 'POST'])
+@auth_bp.route('/login/employee', methods=['GET', 'POST'])
 def login_employee(): return handle_login('employee')
 
-@app.route('/login/supervisor', methods=['GET', 'POST'])
+@auth_bp.route('/login/supervisor', methods=['GET', 'POST'])
 def login_supervisor(): return handle_login('supervisor')
 
-@app.route('/login/hr', methods=['GET', 'POST'])
+@auth_bp.route('/login/hr', methods=['GET', 'POST'])
 def login_hr(): return handle_login('hr')
 
-@app.route('/logout')
+@auth_bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('auth.login'))
 
-@app.route('/register', methods=['GET', 'POST'])
+@employees_bp.route('/register', methods=['GET', 'POST'])
 @login_required
 def register():
     # ... (rest of the routes are unchanged from the last full version)
     if current_user.role not in ['hr', 'supervisor']:
-        flash('You do not have permission.', 'error'); return redirect(url_for('dashboard'))
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
     supervisors = User.query.filter_by(role='supervisor').all()
     if request.method == 'POST':
         if User.query.filter_by(employee_id=request.form['employee_id']).first() or User.query.filter_by(email=request.form['email']).first():
-            flash('Employee ID or email already exists.', 'error'); return redirect(url_for('register'))
+            flash('Employee ID or email already exists.', 'error'); return redirect(url_for('employees.register'))
         new_user_role = 'employee' if current_user.role == 'supervisor' else request.form.get('role', 'employee')
         new_user = User(
             employee_id=request.form['employee_id'], name=request.form['name'], email=request.form['email'],
@@ -135,10 +251,44 @@ def register():
         elif current_user.role == 'hr':
             supervisor_id = request.form.get('supervisor_id')
             if supervisor_id: new_user.supervisor_id = int(supervisor_id)
-        db.session.add(new_user); db.session.commit()
-        flash('New user registered!', 'success'); return redirect(url_for('dashboard'))
+        db.session.add(new_user); db.session.flush(); org_hierarchy.add_user(db, UserHierarchy, new_user.id, new_user.supervisor_id)
+        managers = org_hierarchy.ancestor_ids(db, UserHierarchy, new_user.id)
+        bump_data_version('users'); db.session.commit(); invalidate_dashboard_stats(); current_app.extensions['principals'].invalidate(*managers)
+        flash('New user registered!', 'success'); return redirect(url_for('main.dashboard'))
     return render_template('register.html', supervisors=supervisors)
-@app.route('/dashboard')
+def after_employee_import(employee_ids):
+    # employee_ids lists supervisors before their reports, so each new user attaches below rows that already exist
+    new_users = {}
+    for i in range(0, len(employee_ids), 500):
+        new_users.update((row.employee_id, row) for row in db.session.query(User.employee_id, User.id, User.supervisor_id).filter(User.employee_id.in_(employee_ids[i:i + 500])))
+    for employee_id in employee_ids: org_hierarchy.add_user(db, UserHierarchy, new_users[employee_id].id, new_users[employee_id].supervisor_id)
+    # New reports change the cached team ids of everyone above them
+    managers = set()
+    for i in range(0, len(employee_ids), 500):
+        new_ids = db.select(User.id).where(User.employee_id.in_(employee_ids[i:i + 500]))
+        managers.update(row[0] for row in db.session.query(UserHierarchy.ancestor_id).filter(UserHierarchy.descendant_id.in_(new_ids), UserHierarchy.depth > 0).distinct())
+    bump_data_version('users'); db.session.commit(); invalidate_dashboard_stats(); current_app.extensions['principals'].invalidate(*managers)
+
+@employees_bp.route('/import_employees', methods=['GET', 'POST'])
+@login_required
+def import_employees_view():
+    if current_user.role != 'hr':
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
+    imported = errors = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV file.', 'error'); return redirect(url_for('employees.import_employees_view'))
+        rows = read_import_csv(upload.read())
+        # Password hashing costs ~0.1 s a row; larger files would outlive the worker timeout
+        if len(rows) > current_app.config['IMPORT_MAX_WEB_ROWS']:
+            flash(f"Uploads are limited to {current_app.config['IMPORT_MAX_WEB_ROWS']} rows; import {len(rows)} rows with `flask import-employees`.", 'error')
+            return redirect(url_for('employees.import_employees_view'))
+        imported, errors = import_employees(rows, db, User)
+        if imported: after_employee_import(imported)
+        flash(f'{len(imported)} users imported.', 'success' if imported else 'error')
+    return render_template('import_employees.html', columns=IMPORT_COLUMNS, max_rows=current_app.config['IMPORT_MAX_WEB_ROWS'], imported=imported, errors=errors)
+@main_bp.route('/dashboard')
 @login_required
 def dashboard():
     announcements = Announcement.query.order_by(Announcement.timestamp.desc()).limit(3).all()
@@ -148,252 +298,563 @@ def dashboard():
     elif current_user.role == 'supervisor':
         team_members = User.query.filter_by(supervisor_id=current_user.id).all()
         if current_user.employee_id == MAIN_SUPERVISOR_ID:
-            pending_requests = LeaveRequest.query.filter_by(status='Pending').all()
+            pending_requests = LeaveRequest.query.options(db.joinedload(LeaveRequest.employee)).filter_by(status='Pending').all()
             total_employees = User.query.count()
             return render_template('supervisor_dashboard.html', pending_requests=pending_requests, total_employees=total_employees, team_members=team_members, announcements=announcements)
         else:
-            team_member_ids = [member.id for member in team_members]
-            pending_requests = LeaveRequest.query.filter(LeaveRequest.user_id.in_(team_member_ids), LeaveRequest.status == 'Pending').all()
+            # Everyone under this supervisor at any depth, in one indexed join
+            pending_requests = LeaveRequest.query.options(db.joinedload(LeaveRequest.employee)).filter(
+                LeaveRequest.user_id.in_(org_hierarchy.descendants_query(db, UserHierarchy, current_user.id)), LeaveRequest.status == 'Pending').all()
             return render_template('supervisor_dashboard.html', pending_requests=pending_requests, team_members=team_members, announcements=announcements)
     elif current_user.role == 'hr':
-        search_query = request.args.get('search', ''); role_filter = request.args.get('role', '')
-        query = User.query
-        if search_query: query = query.filter(or_(User.name.ilike(f'%{search_query}%'), User.employee_id.ilike(f'%{search_query}%')))
-        if role_filter: query = query.filter(User.role == role_filter)
-        all_employees = query.order_by(User.name).all()
-        return render_template('hr_dashboard.html', all_employees=all_employees, announcements=announcements)
+        query = User.query.filter(*employee_filters()).options(db.joinedload(User.supervisor))
+        all_employees, next_cursor = keyset_page(query, User, request.args.get('after'), page_size())
+        return render_template('hr_dashboard.html', all_employees=all_employees, announcements=announcements, next_cursor=next_cursor)
     else: return "<h1>Invalid Role</h1>"
-@app.route('/profile', methods=['GET', 'POST'])
+@main_bp.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
     if request.method == 'POST':
         current_password = request.form.get('current_password'); new_password = request.form.get('new_password'); confirm_password = request.form.get('confirm_password')
-        if not current_user.check_password(current_password):
-            flash('Your current password is incorrect.', 'error'); return redirect(url_for('profile'))
+        user = db.session.get(User, current_user.id)
+        if not user.check_password(current_password):
+            flash('Your current password is incorrect.', 'error'); return redirect(url_for('main.profile'))
         if new_password != confirm_password:
-            flash('New passwords do not match.', 'error'); return redirect(url_for('profile'))
-        current_user.set_password(new_password); db.session.commit()
-        flash('Your password has been updated!', 'success'); return redirect(url_for('dashboard'))
+            flash('New passwords do not match.', 'error'); return redirect(url_for('main.profile'))
+        user.set_password(new_password); db.session.commit(); current_app.extensions['principals'].invalidate(user.id)
+        flash('Your password has been updated!', 'success'); return redirect(url_for('main.dashboard'))
     return render_template('profile.html')
-@app.route('/edit_user/<int:user_id>', methods=['GET', 'POST'])
+@employees_bp.route('/edit_user/<int:user_id>', methods=['GET', 'POST'])
 @login_required
 def edit_user(user_id):
     user_to_edit = User.query.get_or_404(user_id)
     if current_user.role != 'hr' and user_to_edit.supervisor_id != current_user.id:
-        flash('You do not have permission to edit this user.', 'error'); return redirect(url_for('dashboard'))
+        flash('You do not have permission to edit this user.', 'error'); return redirect(url_for('main.dashboard'))
     supervisors = User.query.filter_by(role='supervisor').all()
     if request.method == 'POST':
+        previous_supervisor_id = user_to_edit.supervisor_id
         user_to_edit.name = request.form['name']; user_to_edit.email = request.form['email']; user_to_edit.phone_number = request.form['phone_number']
-        user_to_edit.address = request.form['address']; user_to_edit.salary = float(request.form['salary'])
+        new_salary = float(request.form['salary'])
+        if new_salary != user_to_edit.salary: invalidate_payslips(db, PayslipSnapshot, user_id=user_to_edit.id)
+        user_to_edit.address = request.form['address']; user_to_edit.salary = new_salary
+        managers = org_hierarchy.ancestor_ids(db, UserHierarchy, user_to_edit.id)
         if current_user.role == 'hr':
             user_to_edit.role = request.form['role']; supervisor_id = request.form.get('supervisor_id')
             user_to_edit.supervisor_id = int(supervisor_id) if supervisor_id else None
-        db.session.commit()
-        flash(f'Details for {user_to_edit.name} updated.', 'success'); return redirect(url_for('dashboard'))
+            if user_to_edit.supervisor_id != previous_supervisor_id:
+                try: org_hierarchy.move_user(db, UserHierarchy, user_to_edit.id, user_to_edit.supervisor_id)
+                except ValueError as error:
+                    db.session.rollback(); flash(str(error), 'error'); return redirect(url_for('employees.edit_user', user_id=user_id))
+                managers += org_hierarchy.ancestor_ids(db, UserHierarchy, user_to_edit.id)
+        user_id_edited = user_to_edit.id
+        bump_data_version('users'); db.session.commit(); current_app.extensions['principals'].invalidate(user_id_edited, *managers)
+        flash(f'Details for {user_to_edit.name} updated.', 'success'); return redirect(url_for('main.dashboard'))
     return render_template('edit_user.html', user_to_edit=user_to_edit, supervisors=supervisors)
-@app.route('/remove_user/<int:user_id>', methods=['POST'])
+@employees_bp.route('/remove_user/<int:user_id>', methods=['POST'])
 @login_required
 def remove_user(user_id):
     user_to_remove = User.query.get_or_404(user_id); can_remove = False
     if current_user.role == 'hr' and user_to_remove.id != current_user.id: can_remove = True
     if current_user.role == 'supervisor' and user_to_remove.supervisor_id == current_user.id: can_remove = True
     if not can_remove:
-        flash('You do not have permission to remove this user.', 'error'); return redirect(url_for('dashboard'))
-    if user_to_remove.role == 'supervisor':
-        for employee in user_to_remove.employees: employee.supervisor_id = None
+        flash('You do not have permission to remove this user.', 'error'); return redirect(url_for('main.dashboard'))
+    affected_ids = [user_to_remove.id] + org_hierarchy.ancestor_ids(db, UserHierarchy, user_to_remove.id)
+    org_hierarchy.remove_user(db, User, UserHierarchy, user_to_remove.id)
+    # Direct reports become unassigned whatever the removed user's role, so no supervisor_id is left dangling
+    for employee in user_to_remove.employees: employee.supervisor_id = None; affected_ids.append(employee.id)
     LeaveRequest.query.filter_by(user_id=user_to_remove.id).delete()
+    invalidate_payslips(db, PayslipSnapshot, user_id=user_to_remove.id); bump_data_version('leaves', 'users')
     db.session.delete(user_to_remove); db.session.commit()
-    flash(f'User {user_to_remove.name} has been removed.', 'success'); return redirect(url_for('dashboard'))
-@app.route('/apply_leave', methods=['GET', 'POST'])
+    refresh_leave_index(removed_users=[user_id]); invalidate_dashboard_stats(); current_app.extensions['principals'].invalidate(*affected_ids)
+    flash(f'User {user_to_remove.name} has been removed.', 'success'); return redirect(url_for('main.dashboard'))
+@leave_bp.route('/apply_leave', methods=['GET', 'POST'])
 @login_required
 def apply_leave():
     if request.method == 'POST':
         start_date = datetime.strptime(request.form['start_date'], '%Y-%m-%d').date(); end_date = datetime.strptime(request.form['end_date'], '%Y-%m-%d').date()
         if start_date > end_date:
-            flash('End date must be after start date.', 'error'); return redirect(url_for('apply_leave'))
+            flash('End date must be after start date.', 'error'); return redirect(url_for('leave.apply_leave'))
         new_request = LeaveRequest(
             user_id=current_user.id, start_date=start_date, end_date=end_date, reason=request.form['reason'],
             team=request.form['team'], project=request.form['project'],
             team_leader_name=request.form['team_leader_name'], team_leader_mobile=request.form['team_leader_mobile'],
             leave_type=request.form.get('leave_type')
         )
-        db.session.add(new_request); db.session.commit()
-        flash('Leave request submitted!', 'success'); return redirect(url_for('dashboard'))
+        db.session.add(new_request); db.session.commit(); invalidate_dashboard_stats()
+        flash('Leave request submitted!', 'success'); return redirect(url_for('main.dashboard'))
     return render_template('apply_leave.html')
-@app.route('/respond_leave/<int:request_id>/<action>')
+@leave_bp.route('/respond_leave/<int:request_id>/<action>')
 @login_required
 def respond_leave(request_id, action):
     leave_request = LeaveRequest.query.get_or_404(request_id); is_authorized = False
     if current_user.employee_id == MAIN_SUPERVISOR_ID: is_authorized = True
-    if leave_request.employee.supervisor_id == current_user.id: is_authorized = True
+    if org_hierarchy.manages(db, UserHierarchy, current_user.id, leave_request.user_id): is_authorized = True
     if not is_authorized:
-        flash('You do not have permission.', 'error'); return redirect(url_for('dashboard'))
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
     if action == 'approve':
         leave_request.status = 'Approved'; flash(f"Leave for {leave_request.employee.name} approved.", 'success')
     elif action == 'decline':
         leave_request.status = 'Declined'; flash(f"Leave for {leave_request.employee.name} declined.", 'error')
-    db.session.commit(); return redirect(url_for('dashboard'))
-@app.route('/holidays', methods=['GET', 'POST'])
+    invalidate_payslips(db, PayslipSnapshot, user_id=leave_request.user_id, start=leave_request.start_date, end=leave_request.end_date); bump_data_version('leaves')
+    leave = (leave_request.id, leave_request.user_id, leave_request.start_date, leave_request.end_date)
+    approved = leave_request.status == 'Approved'; db.session.commit()
+    refresh_leave_index(approved=[leave] if approved else [], removed=[] if approved else [leave[0]]); invalidate_dashboard_stats()
+    return redirect(url_for('main.dashboard'))
+@leave_bp.route('/respond_leave/batch', methods=['POST'])
+@login_required
+def respond_leave_batch():
+    # Accepts a form post from the supervisor dashboard or JSON {"request_ids": [...], "action": "approve"|"decline"}
+    wants_json = request.is_json
+    if wants_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict): payload = {}
+        request_ids = payload.get('request_ids'); action = payload.get('action')
+        # A string would otherwise be iterated digit by digit ("12" -> requests 1 and 2)
+        valid_ids = isinstance(request_ids, list) and all(type(request_id) is int for request_id in request_ids)
+        request_ids = set(request_ids) if valid_ids else None
+    else:
+        action = request.form.get('action')
+        try: request_ids = {int(request_id) for request_id in request.form.getlist('request_ids')}
+        except ValueError: request_ids = None
+    if action not in LEAVE_ACTIONS or not request_ids:
+        if wants_json: return jsonify({'error': 'Provide request_ids and an action of approve or decline.'}), 400
+        flash('Select at least one leave request.', 'error'); return redirect(url_for('main.dashboard'))
+    # --- Authorize every id against the caller's whole team in one query ---
+    query = db.session.query(LeaveRequest.id, LeaveRequest.user_id, LeaveRequest.start_date, LeaveRequest.end_date).filter(LeaveRequest.id.in_(request_ids))
+    if current_user.employee_id != MAIN_SUPERVISOR_ID:
+        query = query.filter(LeaveRequest.user_id.in_(org_hierarchy.descendants_query(db, UserHierarchy, current_user.id)))
+    leaves = query.all(); status = LEAVE_ACTIONS[action]
+    if leaves:
+        # --- One UPDATE, one invalidation pass, one commit ---
+        LeaveRequest.query.filter(LeaveRequest.id.in_([leave.id for leave in leaves])).update({LeaveRequest.status: status}, synchronize_session=False)
+        invalidate_payslips_for_leaves(db, PayslipSnapshot, [(leave.user_id, leave.start_date, leave.end_date) for leave in leaves]); bump_data_version('leaves')
+        db.session.commit()
+        if status == 'Approved': refresh_leave_index(approved=[tuple(leave) for leave in leaves])
+        else: refresh_leave_index(removed=[leave.id for leave in leaves])
+        invalidate_dashboard_stats()
+    rejected = sorted(request_ids - {leave.id for leave in leaves})
+    if wants_json: return jsonify({'updated': len(leaves), 'status': status, 'rejected': rejected})
+    flash(f"{len(leaves)} leave requests {status.lower()}.", 'success' if status == 'Approved' else 'error')
+    if rejected: flash(f"You do not have permission for {len(rejected)} of the selected requests.", 'error')
+    return redirect(url_for('main.dashboard'))
+
+LEAVE_ACTIONS = {'approve': 'Approved', 'decline': 'Declined'}
+@admin_bp.route('/holidays', methods=['GET', 'POST'])
 @login_required
 def holidays():
-    if current_user.role != 'hr': flash('You do not have permission.', 'error'); return redirect(url_for('dashboard'))
+    if current_user.role != 'hr': flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
     if request.method == 'POST':
         new_holiday = Holiday(date=datetime.strptime(request.form['date'], '%Y-%m-%d').date(), name=request.form['name'], type=request.form.get('type'))
+        invalidate_payslips(db, PayslipSnapshot, start=new_holiday.date, end=new_holiday.date); bump_data_version('holidays')
         db.session.add(new_holiday); db.session.commit()
-        flash('Holiday added!', 'success'); return redirect(url_for('holidays'))
+        flash('Holiday added!', 'success'); return redirect(url_for('admin.holidays'))
     upcoming_holidays = Holiday.query.filter(Holiday.date >= datetime.today()).order_by(Holiday.date).all()
     return render_template('holidays.html', holidays=upcoming_holidays)
-@app.route('/holidays/delete/<int:holiday_id>', methods=['POST'])
+@admin_bp.route('/holidays/delete/<int:holiday_id>', methods=['POST'])
 @login_required
 def delete_holiday(holiday_id):
-    if current_user.role != 'hr': flash('You do not have permission.', 'error'); return redirect(url_for('dashboard'))
+    if current_user.role != 'hr': flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
     holiday = Holiday.query.get_or_404(holiday_id)
+    invalidate_payslips(db, PayslipSnapshot, start=holiday.date, end=holiday.date); bump_data_version('holidays')
     db.session.delete(holiday); db.session.commit()
-    flash('Holiday deleted.', 'success'); return redirect(url_for('holidays'))
-@app.route('/payslip')
+    flash('Holiday deleted.', 'success'); return redirect(url_for('admin.holidays'))
+@payroll_bp.route('/payslip')
 @login_required
+@read_replica
 def view_payslip():
     today = datetime.today()
     year = request.args.get('year', today.year, type=int); month = request.args.get('month', today.month, type=int)
-    payslip_data = calculate_payslip(current_user, year, month, db, Holiday, LeaveRequest)
+    payslip_data = get_payslips(current_user, [(year, month)], db, Holiday, LeaveRequest, PayslipSnapshot, work_calendar=current_app.extensions['work_calendar'].current())[(year, month)]
     return render_template('payslip.html', payslip=payslip_data)
-@app.route('/payslip_history')
+@payroll_bp.route('/payslip_history')
 @login_required
+@read_replica
 def payslip_history():
+    months = list(reversed(month_starts(current_user.date_of_joining, datetime.today())))
     payslips = []
-    start_date = current_user.date_of_joining; end_date = datetime.today()
-    date_range = pd.date_range(start=start_date, end=end_date, freq='MS')
-    for dt in reversed(date_range):
-        payslip = calculate_payslip(current_user, dt.year, dt.month, db, Holiday, LeaveRequest)
-        payslip['year'] = dt.year; payslip['month'] = dt.month
+    for (year, month), payslip in get_payslips(current_user, months, db, Holiday, LeaveRequest, PayslipSnapshot, work_calendar=current_app.extensions['work_calendar'].current()).items():
+        payslip['year'] = year; payslip['month'] = month
         payslips.append(payslip)
     return render_template('payslip_history.html', payslip_history=payslips)
-@app.route('/payroll_report')
+def month_starts(start, end):
+    # (year, month) of every 1st of the month within [start, end]
+    first = start.year * 12 + start.month - 1 + (start.day > 1); last = end.year * 12 + end.month - 1
+    return [(index // 12, index % 12 + 1) for index in range(first, last + 1)]
+@payroll_bp.route('/payroll_report')
 @login_required
+@read_replica
 def payroll_report():
     if current_user.employee_id != MAIN_SUPERVISOR_ID:
-        flash('You do not have permission.', 'error'); return redirect(url_for('dashboard'))
-    today = datetime.today(); search_query = request.args.get('search', ''); role_filter = request.args.get('role', '')
-    query = User.query
-    if search_query: query = query.filter(or_(User.name.ilike(f'%{search_query}%'), User.employee_id.ilike(f'%{search_query}%')))
-    if role_filter: query = query.filter(User.role == role_filter)
-    employees = query.order_by(User.name).all()
-    payroll_data = []
-    for employee in employees:
-        payslip = calculate_payslip(employee, today.year, today.month, db, Holiday, LeaveRequest)
-        payslip['employee_id'] = employee.employee_id
-        payroll_data.append(payslip)
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
+    today = datetime.today()
+    employees, next_cursor = keyset_page(User.query.filter(*employee_filters()), User, request.args.get('after'), page_size())
+    payroll_data = calculate_payroll_batch(employees, today.year, today.month, db, Holiday, LeaveRequest, current_app.extensions['work_calendar'].current())
+    for employee, payslip in zip(employees, payroll_data): payslip['employee_id'] = employee.employee_id
     month_year = today.strftime("%B %Y")
-    return render_template('payroll_report.html', payroll_data=payroll_data, month_year=month_year)
-@app.route('/calendar')
+    return render_template('payroll_report.html', payroll_data=payroll_data, month_year=month_year, next_cursor=next_cursor)
+
+def employee_filters():
+    # The search/role filters shared by the HR dashboard, the payroll report and its export
+    search_query = request.args.get('search', '').strip(); role_filter = request.args.get('role', ''); filters = []
+    if search_query: filters.append(search_filter(db, User, search_query))
+    if role_filter: filters.append(User.role == role_filter)
+    return filters
+
+EMPLOYEE_PAGE_SIZE = 50
+
+def page_size(): return min(max(request.args.get('per_page', EMPLOYEE_PAGE_SIZE, type=int), 1), 200)
+
+EXPORT_BATCH_SIZE = 500
+
+def csv_rows(rows):
+    # Encodes one batch of rows as a CSV text chunk
+    buffer = io.StringIO(); csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+def csv_response(generator, filename):
+    return Response(stream_with_context(generator), mimetype='text/csv', headers={'Content-Disposition': f'attachment;filename={filename}'})
+
+@payroll_bp.route('/payroll_report/export.csv')
+@login_required
+@read_replica
+def export_payroll_report():
+    if current_user.employee_id != MAIN_SUPERVISOR_ID:
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
+    today = datetime.today(); year = request.args.get('year', today.year, type=int); month = request.args.get('month', today.month, type=int)
+    # Checked before streaming starts: an error inside the generator would truncate a 200 response
+    if not (1 <= month <= 12 and 1 <= year <= 9999):
+        flash('Invalid month or year.', 'error'); return redirect(url_for('payroll.payroll_report'))
+    query = db.select(User.id, User.employee_id, User.name, User.salary).where(*employee_filters()).order_by(User.name, User.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    calendar_data = current_app.extensions['work_calendar'].current()
+    def generate():
+        yield csv_rows([['Employee ID', 'Employee Name', 'Month', 'Gross Salary', 'Payable Days', 'Per Day Salary', 'Leave Days Taken', 'Total Deductions', 'Net Payable Salary']])
+        # Employees arrive from the cursor in batches; each batch is priced with one leave query
+        for employees in db.session.execute(query).partitions():
+            payslips = calculate_payroll_batch(employees, year, month, db, Holiday, LeaveRequest, calendar_data)
+            yield csv_rows([[employee.employee_id, p['employee_name'], p['month_year'], f"{p['gross_salary']:.2f}", p['total_payable_days'], f"{p['per_day_salary']:.2f}",
+                             p['deductible_leave_days'], f"{p['deductions']:.2f}", f"{p['net_salary']:.2f}"] for employee, p in zip(employees, payslips)])
+    return csv_response(generate(), f'payroll_{year}-{month:02d}.csv')
+
+@payroll_bp.route('/payroll_forecast')
+@login_required
+def payroll_forecast_view():
+    if current_user.role != 'hr':
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
+    supervisors = db.session.query(User.id, User.name, User.employee_id).filter_by(role='supervisor').order_by(User.name).all()
+    return render_template('payroll_forecast.html', supervisors=supervisors, default_months=FORECAST_MONTHS, max_months=FORECAST_MAX_MONTHS)
+@payroll_bp.route('/api/payroll_forecast', methods=['POST'])
+@login_required
+@read_replica
+def payroll_forecast_api():
+    # JSON {"start": "YYYY-MM", "months": 12, "scenarios": [{"name", "raises": [{"percent", "role"|"team", "from"}], "extra_holidays", "leave_rate"}]}
+    if current_user.role != 'hr':
+        return jsonify({"error": "Permission denied"}), 403
+    payload = request.get_json(silent=True)
+    if payload is None: payload = {}
+    if not isinstance(payload, dict): return jsonify({'error': 'The request body must be a JSON object.'}), 400
+    # Identical what-ifs on unchanged data are answered from the cache
+    versions, _ = get_data_versions('holidays', 'leaves', 'users')
+    key = f"payroll_forecast:{current_app.config['CACHE_NAMESPACE']}:" + hashlib.sha1(repr((sorted(versions.items()), datetime.today().date(), json.dumps(payload, sort_keys=True))).encode()).hexdigest()
+    result = cache.get(key)
+    if result is None:
+        try: result = payroll_forecast(payload.get('scenarios') or [], payload.get('start'), payload.get('months', FORECAST_MONTHS), db, User, LeaveRequest, UserHierarchy, current_app.extensions['work_calendar'].current())
+        except ValueError as error: return jsonify({'error': str(error)}), 400
+        cache.set(key, result)
+    return jsonify(result)
+
+@leave_bp.route('/leave_register/export.csv')
+@login_required
+@read_replica
+def export_leave_register():
+    if current_user.role != 'hr' and current_user.employee_id != MAIN_SUPERVISOR_ID:
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
+    query = db.select(LeaveRequest.id, User.employee_id, User.name, LeaveRequest.leave_type, LeaveRequest.start_date, LeaveRequest.end_date, LeaveRequest.status,
+                      LeaveRequest.team, LeaveRequest.project, LeaveRequest.reason).join(User, LeaveRequest.user_id == User.id)
+    status = request.args.get('status'); start = request.args.get('start'); end = request.args.get('end')
+    if status: query = query.where(LeaveRequest.status == status)
+    try:
+        if start: query = query.where(LeaveRequest.end_date >= datetime.strptime(start, '%Y-%m-%d').date())
+        if end: query = query.where(LeaveRequest.start_date <= datetime.strptime(end, '%Y-%m-%d').date())
+    except ValueError:
+        flash('Invalid start or end date (YYYY-MM-DD).', 'error'); return redirect(url_for('main.dashboard'))
+    query = query.order_by(LeaveRequest.start_date, LeaveRequest.id).execution_options(yield_per=EXPORT_BATCH_SIZE * 2)
+    def generate():
+        yield csv_rows([['Request ID', 'Employee ID', 'Employee Name', 'Leave Type', 'Start Date', 'End Date', 'Total Days', 'Status', 'Team', 'Project', 'Reason']])
+        for rows in db.session.execute(query).partitions():
+            yield csv_rows([[r.id, r.employee_id, r.name, r.leave_type, r.start_date.isoformat(), r.end_date.isoformat(), (r.end_date - r.start_date).days + 1,
+                             r.status, r.team, r.project, r.reason] for r in rows])
+    return csv_response(generate(), 'leave_register.csv')
+@main_bp.route('/calendar')
 @login_required
 def view_calendar(): return render_template('calendar.html')
-@app.route('/add_task', methods=['POST'])
+@main_bp.route('/add_task', methods=['POST'])
 @login_required
 def add_task():
     new_task = PersonalTask(user_id=current_user.id, date=datetime.strptime(request.form['date'], '%Y-%m-%d').date(), task_description=request.form['task_description'])
-    db.session.add(new_task); db.session.commit()
-    flash('Task added!', 'success'); return redirect(url_for('view_calendar'))
-@app.route('/api/events')
+    db.session.add(new_task); bump_data_version('tasks'); db.session.commit()
+    flash('Task added!', 'success'); return redirect(url_for('main.view_calendar'))
+@main_bp.route('/api/events')
 @login_required
+@read_replica
 def api_events():
     events = []; start = request.args.get('start', '').split('T')[0]; end = request.args.get('end', '').split('T')[0]
+    # The feed only changes when one of these counters moves, so FullCalendar re-fetches can be answered with a 304.
+    # Only the ETag is trusted: If-Modified-Since has one-second resolution and would hide a second change within that second
+    versions, last_modified = get_data_versions('holidays', 'leaves', 'tasks', 'users')
+    etag = hashlib.sha1(repr((sorted(versions.items()), current_user.id, start, end)).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        return _events_response(Response(status=304), etag, last_modified)
+    calendar_data = current_app.extensions['work_calendar'].current(); start_date = end_date = None
     try:
-        start_date = datetime.strptime(start, '%Y-%m-%d').date(); end_date = datetime.strptime(end, '%Y-%m-%d').date(); current_date = start_date
-        while current_date <= end_date:
-            if current_date.weekday() == 6: events.append({'title': 'Sunday Holiday', 'start': current_date.isoformat(), 'allDay': True, 'backgroundColor': '#ffe5e5', 'borderColor': '#ffe5e5', 'display': 'background'})
-            current_date += timedelta(days=1)
-    except (ValueError, TypeError): pass
-    holidays = Holiday.query.all()
-    for h in holidays:
-        event_data = {'title': h.name, 'start': h.date.isoformat(), 'allDay': True}
-        if h.type == 'company_event': event_data['backgroundColor'] = '#D90429'; event_data['borderColor'] = '#D90429'
+        start_date = datetime.strptime(start, '%Y-%m-%d').date(); end_date = datetime.strptime(end, '%Y-%m-%d').date()
+        for sunday in calendar_data.sundays_between(start_date, end_date): events.append({'title': 'Sunday Holiday', 'start': sunday.isoformat(), 'allDay': True, 'backgroundColor': '#ffe5e5', 'borderColor': '#ffe5e5', 'display': 'background'})
+    except (ValueError, TypeError): start_date = end_date = None
+    holidays = calendar_data.holidays_between(start_date, end_date) if start_date else calendar_data.holidays
+    for h_date, h_name, h_type in holidays:
+        event_data = {'title': h_name, 'start': h_date.isoformat(), 'allDay': True}
+        if h_type == 'company_event': event_data['backgroundColor'] = '#D90429'; event_data['borderColor'] = '#D90429'
         else: event_data['display'] = 'list-item'; event_data['backgroundColor'] = '#e76f51'; event_data['borderColor'] = '#e76f51'
         events.append(event_data)
-    leaves_query = LeaveRequest.query.filter_by(status='Approved')
-    if current_user.role == 'hr' or current_user.employee_id == MAIN_SUPERVISOR_ID: leaves = leaves_query.all()
+    if current_user.role == 'hr' or current_user.employee_id == MAIN_SUPERVISOR_ID: visible_ids = None
     elif current_user.role == 'supervisor':
-        team_member_ids = [member.id for member in current_user.employees]; team_member_ids.append(current_user.id)
-        leaves = leaves_query.filter(LeaveRequest.user_id.in_(team_member_ids)).all()
-    else: leaves = leaves_query.filter_by(user_id=current_user.id).all()
-    for l in leaves: events.append({'title': f"On Leave: {l.employee.name}", 'start': l.start_date.isoformat(), 'end': l.end_date.isoformat(), 'backgroundColor': '#2a9d8f', 'borderColor': '#2a9d8f'})
-    tasks = PersonalTask.query.filter_by(user_id=current_user.id).all()
-    for t in tasks: events.append({'title': t.task_description, 'start': t.date.isoformat(), 'allDay': True, 'backgroundColor': '#264653', 'borderColor': '#264653'})
-    return jsonify(events)
-@app.route('/view_letter/<int:request_id>')
+        visible_ids = set(current_user.team_ids); visible_ids.add(current_user.id)
+    else: visible_ids = {current_user.id}
+    leaves = current_app.extensions['leave_index'].current().overlapping(start_date, end_date, user_ids=visible_ids)
+    names = {}; leave_user_ids = list({l[1] for l in leaves})
+    for i in range(0, len(leave_user_ids), 500): names.update(db.session.query(User.id, User.name).filter(User.id.in_(leave_user_ids[i:i + 500])).all())
+    for _, user_id, leave_start, leave_end in leaves: events.append({'title': f"On Leave: {names.get(user_id)}", 'start': leave_start.isoformat(), 'end': leave_end.isoformat(), 'backgroundColor': '#2a9d8f', 'borderColor': '#2a9d8f'})
+    tasks_query = db.session.query(PersonalTask.task_description, PersonalTask.date).filter_by(user_id=current_user.id)
+    if start_date: tasks_query = tasks_query.filter(PersonalTask.date >= start_date, PersonalTask.date <= end_date)
+    for description, task_date in tasks_query.all(): events.append({'title': description, 'start': task_date.isoformat(), 'allDay': True, 'backgroundColor': '#264653', 'borderColor': '#264653'})
+    return _events_response(jsonify(events), etag, last_modified)
+
+def _events_response(response, etag, last_modified):
+    response.set_etag(etag); response.cache_control.private = True; response.cache_control.no_cache = True
+    if last_modified: response.last_modified = last_modified
+    return response
+@leave_bp.route('/view_letter/<int:request_id>')
 @login_required
 def view_letter(request_id):
     leave_request = LeaveRequest.query.get_or_404(request_id)
     if current_user.role == 'employee' and leave_request.user_id != current_user.id:
-        flash('You do not have permission.', 'error'); return redirect(url_for('dashboard'))
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
     today_date = datetime.today().strftime('%d-%b-%Y'); total_days = (leave_request.end_date - leave_request.start_date).days + 1
     return render_template('view_letter.html', leave_request=leave_request, today_date=today_date, total_days=total_days)
-@app.route('/download_letter/<int:request_id>')
+@leave_bp.route('/download_letter/<int:request_id>')
 @login_required
 def download_letter(request_id):
     leave_request = LeaveRequest.query.get_or_404(request_id)
     if current_user.role == 'employee' and leave_request.user_id != current_user.id:
-        flash('You do not have permission.', 'error'); return redirect(url_for('dashboard'))
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
     today_date = datetime.today().strftime('%d-%b-%Y'); total_days = (leave_request.end_date - leave_request.start_date).days + 1
     html = render_template('view_letter.html', leave_request=leave_request, today_date=today_date, total_days=total_days)
-    pdf = HTML(string=html).write_pdf()
-    return Response(pdf, mimetype='application/pdf', headers={'Content-Disposition': f'attachment;filename=leave_request_{leave_request.employee.employee_id}.pdf'})
-@app.route('/analytics')
+    status, path = current_app.extensions['letter_renderer'].request(html)
+    if status == PdfRenderer.READY:
+        return send_file(path, mimetype='application/pdf', as_attachment=True, download_name=f'leave_request_{leave_request.employee.employee_id}.pdf', max_age=0)
+    if status == PdfRenderer.FAILED:
+        flash('Could not generate the PDF letter. Please try again.', 'error'); return redirect(url_for('leave.view_letter', request_id=request_id))
+    # Still rendering (or the render queue is full): ask the browser to come back instead of holding this worker
+    code = 202 if status == PdfRenderer.PENDING else 503
+    return Response('<meta http-equiv="refresh" content="2"><p>Your letter is being prepared. The download will start shortly.</p>', status=code, mimetype='text/html', headers={'Retry-After': '2'})
+@admin_bp.route('/analytics')
 @login_required
 def analytics_dashboard():
     if current_user.role not in ['hr', 'supervisor']:
-        flash('You do not have permission.', 'error'); return redirect(url_for('dashboard'))
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
     return render_template('analytics_dashboard.html')
-@app.route('/api/dashboard_stats')
+@admin_bp.route('/api/dashboard_stats')
 @login_required
+@read_replica
 def dashboard_stats():
     if current_user.role not in ['hr', 'supervisor']:
         return jsonify({"error": "Permission denied"}), 403
-    total_employees = User.query.count()
-    on_leave_today = LeaveRequest.query.filter(LeaveRequest.status=='Approved', LeaveRequest.start_date <= datetime.today().date(), LeaveRequest.end_date >= datetime.today().date()).count()
-    pending_requests = LeaveRequest.query.filter(LeaveRequest.status=='Pending').count()
+    stats = cache.get(dashboard_stats_key())
+    if stats is None:
+        stats = compute_dashboard_stats(); cache.set(dashboard_stats_key(), stats, timeout=current_app.config['DASHBOARD_STATS_TTL'])
+    return jsonify(stats)
+
+DASHBOARD_STATS_KEY = 'dashboard_stats'
+
+def dashboard_stats_key(): return f"{DASHBOARD_STATS_KEY}:{current_app.config['CACHE_NAMESPACE']}"
+
+def invalidate_dashboard_stats(): cache.delete(dashboard_stats_key())
+
+def compute_dashboard_stats():
     today = datetime.today()
-    leave_type_data = db.session.query(LeaveRequest.leave_type, func.count(LeaveRequest.id)).filter(
-        db.extract('month', LeaveRequest.start_date) == today.month, db.extract('year', LeaveRequest.start_date) == today.year, LeaveRequest.status == 'Approved'
-    ).group_by(LeaveRequest.leave_type).all()
-    leave_type_breakdown = {'labels': [item[0] for item in leave_type_data], 'data': [item[1] for item in leave_type_data]}
-    labels = []; data = []
-    for i in range(5, -1, -1):
-        target_date = today.replace(day=1) - timedelta(days=i*30)
-        labels.append(target_date.strftime("%B %Y"))
-        monthly_leaves = LeaveRequest.query.filter(
-            db.extract('month', LeaveRequest.start_date) == target_date.month,
-            db.extract('year', LeaveRequest.start_date) == target_date.year,
-            LeaveRequest.status == 'Approved'
-        ).count()
-        data.append(monthly_leaves)
-    leave_trend = {'labels': labels, 'data': data}
-    return jsonify({'total_employees': total_employees, 'on_leave_today': on_leave_today, 'pending_requests': pending_requests, 'leave_type_breakdown': leave_type_breakdown, 'leave_trend': leave_trend})
-@app.route('/announcements', methods=['GET', 'POST'])
+    total_employees, pending_requests = db.session.query(
+        db.select(func.count(User.id)).scalar_subquery(),
+        db.select(func.count(LeaveRequest.id)).where(LeaveRequest.status == 'Pending').scalar_subquery()
+    ).one()
+    on_leave_today = current_app.extensions['leave_index'].current().count_overlapping(today.date(), today.date())
+    # The trend months step back 30 days at a time from the 1st of this month
+    trend_months = [today.replace(day=1) - timedelta(days=i*30) for i in range(5, -1, -1)]
+    # One grouped pass over approved leaves starting in the trend window feeds both charts
+    year_col = db.extract('year', LeaveRequest.start_date); month_col = db.extract('month', LeaveRequest.start_date)
+    monthly_counts = db.session.query(year_col, month_col, LeaveRequest.leave_type, func.count(LeaveRequest.id)).filter(
+        LeaveRequest.status == 'Approved', LeaveRequest.start_date >= min(trend_months).date().replace(day=1)
+    ).group_by(year_col, month_col, LeaveRequest.leave_type).all()
+    counts = {}
+    for year, month, leave_type, count in monthly_counts: counts.setdefault((int(year), int(month)), {})[leave_type] = count
+    this_month = sorted(counts.get((today.year, today.month), {}).items(), key=lambda item: str(item[0]))
+    leave_type_breakdown = {'labels': [item[0] for item in this_month], 'data': [item[1] for item in this_month]}
+    leave_trend = {'labels': [d.strftime("%B %Y") for d in trend_months], 'data': [sum(counts.get((d.year, d.month), {}).values()) for d in trend_months]}
+    return {'total_employees': total_employees, 'on_leave_today': on_leave_today, 'pending_requests': pending_requests, 'leave_type_breakdown': leave_type_breakdown, 'leave_trend': leave_trend}
+@admin_bp.route('/announcements', methods=['GET', 'POST'])
 @login_required
 def manage_announcements():
     if current_user.role != 'hr':
-        flash('You do not have permission.', 'error'); return redirect(url_for('dashboard'))
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
     if request.method == 'POST':
         content = request.form.get('content')
         if content:
             announcement = Announcement(content=content, user_id=current_user.id)
             db.session.add(announcement); db.session.commit()
             flash('Announcement posted!', 'success')
-        return redirect(url_for('manage_announcements'))
+        return redirect(url_for('admin.manage_announcements'))
     announcements = Announcement.query.order_by(Announcement.timestamp.desc()).all()
     return render_template('announcements.html', announcements=announcements)
-@app.route('/announcements/delete/<int:announcement_id>', methods=['POST'])
+@admin_bp.route('/announcements/delete/<int:announcement_id>', methods=['POST'])
 @login_required
 def delete_announcement(announcement_id):
     if current_user.role != 'hr':
-        flash('You do not have permission.', 'error'); return redirect(url_for('dashboard'))
+        flash('You do not have permission.', 'error'); return redirect(url_for('main.dashboard'))
     announcement = Announcement.query.get_or_404(announcement_id)
     db.session.delete(announcement); db.session.commit()
     flash('Announcement deleted.', 'success')
-    return redirect(url_for('manage_announcements'))
+    return redirect(url_for('admin.manage_announcements'))
 
-@app.cli.command("init-db")
+@click.command("init-db")
+@with_appcontext
 def init_db_command():
-    db.create_all()
-    print("Initialized the database.")
\ No newline at end of file
+    upgrade_schema()
+    print("Initialized the database.")
+
+@click.command("import-employees")
+@with_appcontext
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--workers', type=int, default=None, help='Password hashing processes (default: all cores).')
+@click.option('--errors', 'errors_file', type=click.File('w'), default=None, help='Write the per-row error report to this CSV file.')
+def import_employees_command(csv_file, workers, errors_file):
+    """Bulk-create users from a CSV file."""
+    started = time.monotonic()
+    imported, errors = import_employees(read_import_csv(csv_file), db, User, workers)
+    if imported: after_employee_import(imported)
+    for error in errors: print(f"line {error['line']} ({error['employee_id']}): {error['error']}")
+    if errors_file:
+        writer = csv.DictWriter(errors_file, fieldnames=['line', 'employee_id', 'error']); writer.writeheader(); writer.writerows(errors)
+    print(f"Imported {len(imported)} users, rejected {len(errors)} rows in {time.monotonic() - started:.1f}s.")
+
+@click.command("payslip-pdfs")
+@with_appcontext
+@click.option('--year', type=int, default=lambda: datetime.today().year)
+@click.option('--month', type=int, default=lambda: datetime.today().month)
+@click.option('--output', type=click.Path(file_okay=False), default=None, help='Directory for the PDFs (default: payslips-YYYY-MM).')
+@click.option('--zip', 'zip_path', type=click.Path(dir_okay=False), default=None, help='Also pack the finished directory into this ZIP file.')
+@click.option('--workers', type=int, default=os.cpu_count(), help='Rendering processes (default: all cores).')
+def payslip_pdfs_command(year, month, output, zip_path, workers):
+    """Render every employee's payslip for a month as PDFs. Re-running resumes where it stopped."""
+    use_replica()
+    output = output or f'payslips-{year}-{month:02d}'; os.makedirs(output, exist_ok=True)
+    for filename in os.listdir(output):
+        if filename.endswith('.tmp'): os.remove(os.path.join(output, filename))  # left behind by an interrupted run
+    done = set(os.listdir(output)); calendar_data = current_app.extensions['work_calendar'].current()
+    total = User.query.count(); started = time.monotonic()
+    progress = {'rendered': 0, 'skipped': 0, 'reported': started}
+
+    def collect(futures, return_when):
+        finished, pending = wait(futures, return_when=return_when)
+        for future in finished: future.result()
+        progress['rendered'] += len(finished); now = time.monotonic()
+        if now - progress['reported'] >= 1 or not pending:
+            rate = progress['rendered'] / (now - started); remaining = total - progress['rendered'] - progress['skipped']
+            print(f"[{progress['rendered'] + progress['skipped']}/{total}] {rate:.1f} PDFs/s, ETA {remaining / rate if rate else 0:.0f}s", flush=True)
+            progress['reported'] = now
+        return pending
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = set(); last_id = 0
+        while True:
+            # Walk employees in id order, one batch at a time, so memory stays flat whatever the headcount
+            employees = User.query.filter(User.id > last_id).order_by(User.id).limit(BULK_PAYSLIP_BATCH).all()
+            if not employees: break
+            last_id = employees[-1].id
+            for employee, payslip in zip(employees, calculate_payroll_batch(employees, year, month, db, Holiday, LeaveRequest, calendar_data)):
+                filename = f'payslip_{employee.employee_id}_{year}-{month:02d}.pdf'
+                if filename in done: progress['skipped'] += 1; continue
+                html = render_template('payslip_pdf.html', payslip=payslip, employee_id=employee.employee_id)
+                in_flight.add(pool.submit(render_pdf_file, html, os.path.join(output, filename)))
+                if len(in_flight) >= workers * 4: in_flight = collect(in_flight, FIRST_COMPLETED)
+            db.session.expunge_all()
+        if in_flight: collect(in_flight, ALL_COMPLETED)
+    elapsed = time.monotonic() - started
+    print(f"Rendered {progress['rendered']} payslips ({progress['skipped']} already present) in {elapsed:.1f}s, {progress['rendered'] / elapsed:.1f} PDFs/s -> {output}")
+    if zip_path:
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for filename in sorted(os.listdir(output)):
+                if filename.endswith('.pdf'): archive.write(os.path.join(output, filename), filename)
+        print(f"Packed {zip_path}")
+
+BULK_PAYSLIP_BATCH = 500
+
+@click.command("sync-replica")
+@with_appcontext
+def sync_replica_command():
+    """Copy the primary SQLite database onto the SQLite replica (for trying replica routing locally)."""
+    if REPLICA_BIND not in db.engines: raise click.ClickException('Set DATABASE_REPLICA_URL to configure a replica.')
+    primary, replica = db.engines[None], db.engines[REPLICA_BIND]
+    if primary.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        raise click.ClickException('sync-replica only copies SQLite files; use your database\'s replication for anything else.')
+    replica.dispose()
+    with sqlite3.connect(primary.url.database) as source, sqlite3.connect(replica.url.database) as target: source.backup(target)
+    print(f"Copied {primary.url.database} to {replica.url.database}.")
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'a_very_secret_key_that_should_be_changed_in_production')
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(basedir, "database.db")}')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Shared by every gunicorn worker of this instance; set CACHE_TYPE=RedisCache and CACHE_REDIS_URL to share across hosts
+    app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'FileSystemCache')
+    app.config['CACHE_DIR'] = os.environ.get('CACHE_DIR')  # default: <instance path>/cache
+    # Room for a principal per user plus the reports; past it every set() sweeps the directory
+    app.config['CACHE_THRESHOLD'] = int(os.environ.get('CACHE_THRESHOLD', 200_000))
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL')
+    app.config['CACHE_DEFAULT_TIMEOUT'] = 300
+    app.config['DASHBOARD_STATS_TTL'] = int(os.environ.get('DASHBOARD_STATS_TTL', 60))
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 300))
+    app.config['IMPORT_MAX_WEB_ROWS'] = int(os.environ.get('IMPORT_MAX_WEB_ROWS', 200))
+    app.config['PDF_CACHE_DIR'] = os.environ.get('PDF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'hr-payroll-pdf'))
+    app.config['PDF_RENDER_WORKERS'] = int(os.environ.get('PDF_RENDER_WORKERS', 2))
+    app.config['PDF_RENDER_QUEUE'] = int(os.environ.get('PDF_RENDER_QUEUE', 16))
+    # Letters embed the day they were issued, so a cached PDF is only useful for a day or so
+    app.config['PDF_CACHE_MAX_AGE'] = int(os.environ.get('PDF_CACHE_MAX_AGE', 2 * 86400))
+    app.config['SLOW_REQUEST_MS'] = int(os.environ.get('SLOW_REQUEST_MS', 0))
+    app.config['N_PLUS_ONE_THRESHOLD'] = int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5))
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+    app.config['DATABASE_REPLICA_URL'] = os.environ.get('DATABASE_REPLICA_URL')
+    if config: app.config.update(config)
+    # Pool sizing from DB_* (primary) and DB_REPLICA_* (replica) environment variables
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    if app.config['DATABASE_REPLICA_URL']:
+        app.config.setdefault('SQLALCHEMY_BINDS', {REPLICA_BIND: {'url': app.config['DATABASE_REPLICA_URL'], **engine_options(app.config['DATABASE_REPLICA_URL'], 'DB_REPLICA_')}})
+    # Cached principals and reports belong to one database; scope the keys to it so apps sharing a cache store never read each other's entries
+    app.config.setdefault('CACHE_NAMESPACE', hashlib.sha1(app.config['SQLALCHEMY_DATABASE_URI'].encode()).hexdigest()[:16])
+    app.config.setdefault('CACHE_KEY_PREFIX', f"hr-payroll:{app.config['CACHE_NAMESPACE']}:")
+    if app.config['CACHE_TYPE'] == 'FileSystemCache':
+        # cachelib unpickles whatever is in this directory, so keep it private to the app instead of at a guessable path in /tmp
+        app.config['CACHE_DIR'] = app.config['CACHE_DIR'] or os.path.join(app.instance_path, 'cache')
+        os.makedirs(app.config['CACHE_DIR'], mode=0o700, exist_ok=True); os.chmod(app.config['CACHE_DIR'], 0o700)
+    db.init_app(app); cache.init_app(app); login_manager.init_app(app)
+    # Per-app services: each app built by create_app() keeps its own caches and metrics
+    app.extensions['work_calendar'] = WorkingDayCalendarService(load_holidays, lambda: get_data_version('holidays'))
+    app.extensions['leave_index'] = LeaveIndexService(load_approved_leaves, lambda: get_data_version('leaves'))
+    app.extensions['principals'] = PrincipalCache(cache, load_principal_data, app.config['USER_CACHE_TTL'], app.config['CACHE_NAMESPACE'])
+    app.extensions['letter_renderer'] = PdfRenderer(app.config['PDF_CACHE_DIR'], app.config['PDF_RENDER_WORKERS'], app.config['PDF_RENDER_QUEUE'], app.config['PDF_CACHE_MAX_AGE'])
+    for blueprint in (auth_bp, main_bp, employees_bp, leave_bp, payroll_bp, admin_bp): app.register_blueprint(blueprint)
+    for command in (init_db_command, import_employees_command, payslip_pdfs_command, sync_replica_command): app.cli.add_command(command)
+    # Without METRICS_TOKEN only signed-in HR users can read /metrics
+    app.extensions['request_metrics'] = RequestMetrics(app, db, allow=lambda: current_user.is_authenticated and current_user.role == 'hr')
+    return app
+
+# gunicorn app:app and `flask init-db` use this instance
+app = create_app()
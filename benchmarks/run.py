@@ -0,0 +1,143 @@
+"""
+Benchmarks for the payroll and reporting hot paths.
+
+    python -m benchmarks.run --scale small --save benchmarks/baseline-small.json
+    python -m benchmarks.run --scale small --compare benchmarks/baseline-small.json
+
+Seeds a dedicated database with benchmarks.synthetic_data (unless --reuse), then
+times each case through the Flask test client (calculate_payslip directly), recording
+the cold first call, the median of --repeat warm calls and the SQL statements per call.
+Caches, including a dedicated PDF cache directory, are emptied before each case, and a
+202/503 response is polled until the final one, so a cold download_letter includes the render.
+--compare exits non-zero when a case is slower than the baseline by more than --threshold.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+from benchmarks.synthetic_data import SCALES
+
+# Seconds between polls of a response that asked the client to retry (a PDF still rendering)
+POLL_INTERVAL = 0.05
+
+
+def _cases(app_module, info):
+    db = app_module.db; User = app_module.User
+    today = date.today()
+
+    def payslips():
+        for employee in User.query.filter_by(role='employee').order_by(User.id).limit(50).all():
+            app_module.calculate_payslip(employee, today.year, today.month, db, app_module.Holiday, app_module.LeaveRequest)
+
+    with app_module.app.app_context():
+        employee = User.query.filter_by(employee_id=info['employee']).one()
+        leave = app_module.LeaveRequest.query.filter_by(user_id=employee.id).first()
+    month_start = today.replace(day=1).isoformat()
+    return [
+        ('calculate_payslip x50', None, payslips),
+        ('payroll_report', 'main_supervisor', '/payroll_report'),
+        ('payroll_report export', 'main_supervisor', '/payroll_report/export.csv'),
+        ('payslip_history', 'employee', '/payslip_history'),
+        ('api_events (hr, month)', 'hr', f'/api/events?start={month_start}T00:00:00&end={today.isoformat()}T00:00:00'),
+        ('api_events (supervisor, month)', 'supervisor', f'/api/events?start={month_start}T00:00:00&end={today.isoformat()}T00:00:00'),
+        ('dashboard_stats', 'hr', '/api/dashboard_stats'),
+        ('dashboard (hr)', 'hr', '/dashboard'),
+        ('download_letter', 'employee', f'/download_letter/{leave.id}' if leave else None),
+    ]
+
+
+def _login(app_module, info, role):
+    client = app_module.app.test_client()
+    login_role = {'main_supervisor': 'supervisor'}.get(role, role)
+    response = client.post(f'/login/{login_role}', data={'employee_id': info[role], 'password': info['password']})
+    if response.status_code != 302: raise RuntimeError(f'Could not log in as {role}')
+    return client
+
+
+def run(app_module, info, repeat):
+    statements = []
+    from sqlalchemy import event
+    with app_module.app.app_context():
+        event.listen(app_module.db.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+    results = {}
+    for name, role, target in _cases(app_module, info):
+        if target is None: continue
+        app_module.cache.clear()
+        for path in glob.glob(os.path.join(app_module.app.config['PDF_CACHE_DIR'], '*.pdf')): os.remove(path)
+        client = _login(app_module, info, role) if role else None
+        timings, counts, status = [], [], None
+        for _ in range(repeat + 1):
+            statements.clear(); started = time.perf_counter()
+            if client:
+                response = client.get(target); response.get_data()
+                while response.status_code in (202, 503):
+                    time.sleep(POLL_INTERVAL); response = client.get(target); response.get_data()
+                status = response.status_code
+            else:
+                with app_module.app.app_context(): target()
+            timings.append(time.perf_counter() - started); counts.append(len(statements))
+        results[name] = {'cold_ms': timings[0] * 1000, 'warm_ms': statistics.median(timings[1:]) * 1000,
+                         'queries_cold': counts[0], 'queries_warm': statistics.median(counts[1:]), 'status': status}
+    return results
+
+
+def report(results, baseline=None, threshold=1.2):
+    regressions = []
+    print(f"{'case':34} {'cold ms':>10} {'warm ms':>10} {'queries':>9} {'status':>6}" + (f" {'vs base':>9}" if baseline else ''))
+    for name, result in results.items():
+        line = f"{name:34} {result['cold_ms']:10.1f} {result['warm_ms']:10.1f} {result['queries_cold']:>4}/{result['queries_warm']:<4} {result['status'] or '-':>6}"
+        if baseline and name in baseline:
+            ratio = result['warm_ms'] / baseline[name]['warm_ms'] if baseline[name]['warm_ms'] else 1.0
+            flag = ' SLOWER' if ratio > threshold else ' faster' if ratio < 1 / threshold else ''
+            line += f" {ratio:8.2f}x{flag}"
+            if ratio > threshold: regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default='small', help='small (100), medium (10k), large (100k) or a number of employees')
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database', default=None, help='SQLAlchemy URL (default: a SQLite file per scale in the temp dir)')
+    parser.add_argument('--reuse', action='store_true', help='Skip seeding and reuse the existing benchmark database')
+    parser.add_argument('--save', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare against a JSON file written by --save')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Slowdown ratio that counts as a regression')
+    args = parser.parse_args()
+
+    employees = SCALES.get(args.scale) or int(args.scale)
+    os.environ['DATABASE_URL'] = args.database or f"sqlite:///{os.path.join(tempfile.gettempdir(), f'hr-payroll-bench-{employees}.db')}"
+    os.environ.setdefault('CACHE_TYPE', 'SimpleCache')
+    # Rendered letters are deleted between cases, so never point this at a shared cache
+    os.environ['PDF_CACHE_DIR'] = tempfile.mkdtemp(prefix='hr-payroll-bench-pdf-')
+    import app as app_module
+    from benchmarks.synthetic_data import BENCH_PASSWORD, generate
+    with app_module.app.app_context():
+        if args.reuse:
+            info = {'hr': 'HR-0001', 'main_supervisor': app_module.MAIN_SUPERVISOR_ID, 'supervisor': 'SUP-000000', 'employee': 'EMP-000000', 'password': BENCH_PASSWORD}
+        else:
+            started = time.perf_counter(); info = generate(app_module, employees, args.years, seed=args.seed)
+            print(f"Seeded {info['employees']} users in {time.perf_counter() - started:.1f}s")
+    results = run(app_module, info, args.repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as handle: baseline = json.load(handle)['results']
+    regressions = report(results, baseline, args.threshold)
+    if args.save:
+        with open(args.save, 'w') as handle: json.dump({'scale': employees, 'years': args.years, 'results': results}, handle, indent=2)
+    app_module.app.extensions['letter_renderer'].shutdown()
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}"); sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
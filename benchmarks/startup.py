@@ -0,0 +1,52 @@
+"""
+Worker boot cost: how long `import app` takes and how much memory it leaves resident.
+
+    python -m benchmarks.startup --repeat 5
+
+Each sample runs in a fresh interpreter, as a new gunicorn worker would, and reports
+the wall time to import the module and build the app, the resident set size right
+after, and which of the heavy optional libraries ended up loaded.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ['numpy', 'pandas', 'weasyprint']
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+elapsed = time.perf_counter() - started
+rss_kb = 0
+with open('/proc/self/status') as status:
+    for line in status:
+        if line.startswith('VmRSS:'): rss_kb = int(line.split()[1])
+print(json.dumps({'boot_ms': elapsed * 1000, 'rss_mb': rss_kb / 1024, 'loaded': [name for name in %r if name in sys.modules]}))
+""" % HEAVY_MODULES
+
+
+def sample(root):
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.gettempdir(), 'hr-payroll-startup.db')}")
+    env.setdefault('CACHE_TYPE', 'SimpleCache')
+    output = subprocess.run([sys.executable, '-c', _PROBE], cwd=root, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters to sample')
+    parser.add_argument('--root', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), help='Checkout to measure (default: this one)')
+    args = parser.parse_args()
+    samples = [sample(args.root) for _ in range(args.repeat)]
+    boot = statistics.median(s['boot_ms'] for s in samples); rss = statistics.median(s['rss_mb'] for s in samples)
+    print(f"boot {boot:.0f} ms (min {min(s['boot_ms'] for s in samples):.0f}), RSS {rss:.1f} MB, loaded at boot: {', '.join(samples[0]['loaded']) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
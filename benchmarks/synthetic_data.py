@@ -0,0 +1,104 @@
+"""
+Seeded synthetic data for benchmarks.
+
+    python -m benchmarks.synthetic_data --employees 10000 --years 3 --database sqlite:///bench.db
+
+Fills User, UserHierarchy (via upgrade_schema), LeaveRequest, Holiday, PersonalTask
+and Announcement. The same seed and scale always produce the same rows.
+
+generate() drops and recreates every table. Without --database the CLI writes to a
+SQLite file per scale in the temp dir (the one benchmarks.run uses), never to DATABASE_URL.
+"""
+import argparse
+import os
+import random
+import tempfile
+from datetime import date, timedelta
+
+SCALES = {'small': 100, 'medium': 10_000, 'large': 100_000}
+LEAVE_TYPES = ['Sick', 'Casual', 'Annual', 'Other']
+STATUSES = ['Approved'] * 6 + ['Declined', 'Pending']
+TEAM_SIZE = 10
+BENCH_PASSWORD = 'bench'
+INSERT_CHUNK = 5000
+
+
+def _insert(db, model, rows):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(db.insert(model), rows[i:i + INSERT_CHUNK])
+    db.session.commit()
+
+
+def generate(app_module, employees=100, years=3, leaves_per_year=6, seed=42, today=None):
+    """Creates the schema and fills it; returns a dict of handy ids for the benchmarks."""
+    from werkzeug.security import generate_password_hash
+    db = app_module.db; User = app_module.User
+    rnd = random.Random(seed); today = today or date.today()
+    history_start = date(today.year - years, 1, 1)
+    password_hash = generate_password_hash(BENCH_PASSWORD)  # hashed once; every user shares it
+
+    db.drop_all(); db.create_all()
+    # --- Users: HR, the main supervisor, one supervisor per TEAM_SIZE employees ---
+    supervisors = max(1, employees // TEAM_SIZE)
+    users = [
+        dict(id=1, employee_id='HR-0001', name='Hana HR', email='hr@bench.test', role='hr', salary=90000.0, supervisor_id=None, date_of_joining=history_start),
+        dict(id=2, employee_id=app_module.MAIN_SUPERVISOR_ID, name='Main Supervisor', email='main@bench.test', role='supervisor', salary=150000.0, supervisor_id=None, date_of_joining=history_start),
+    ]
+    for i in range(supervisors):
+        users.append(dict(id=3 + i, employee_id=f'SUP-{i:06d}', name=f'Supervisor {i:06d}', email=f'sup{i}@bench.test', role='supervisor',
+                          salary=float(rnd.randrange(60000, 120000, 500)), supervisor_id=2, date_of_joining=history_start))
+    first_employee = 3 + supervisors
+    for i in range(employees):
+        joined = history_start + timedelta(days=rnd.randint(0, 365 * years))
+        users.append(dict(id=first_employee + i, employee_id=f'EMP-{i:06d}', name=f'{rnd.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ")}mployee {i:06d}', email=f'emp{i}@bench.test',
+                          role='employee', salary=float(rnd.randrange(20000, 90000, 100)), supervisor_id=3 + i % supervisors, date_of_joining=joined))
+    for user in users: user['password_hash'] = password_hash
+    _insert(db, User, users)
+
+    # --- Holidays: a dozen a year ---
+    holidays, seen = [], set()
+    for year in range(history_start.year, today.year + 2):
+        for n in range(12):
+            day = date(year, rnd.randint(1, 12), rnd.randint(1, 28))
+            if day not in seen:
+                seen.add(day); holidays.append(dict(date=day, name=f'Holiday {year}-{n}', type=rnd.choice(['government', 'company_event'])))
+    _insert(db, app_module.Holiday, holidays)
+
+    # --- Leave history, tasks and announcements ---
+    leaves, tasks = [], []
+    for user in users[2:]:
+        span = (today - user['date_of_joining']).days
+        for _ in range(max(1, int(leaves_per_year * span / 365))):
+            start = user['date_of_joining'] + timedelta(days=rnd.randint(0, max(span, 1)))
+            leaves.append(dict(user_id=user['id'], start_date=start, end_date=start + timedelta(days=rnd.choice([0, 0, 1, 2, 4, 9])),
+                               status=rnd.choice(STATUSES), leave_type=rnd.choice(LEAVE_TYPES), reason='Synthetic', team='Team', project='Project',
+                               team_leader_name='Lead', team_leader_mobile='0000000000'))
+            if len(leaves) >= INSERT_CHUNK: _insert(db, app_module.LeaveRequest, leaves); leaves = []
+        for _ in range(rnd.randint(0, 3)):
+            tasks.append(dict(user_id=user['id'], date=today - timedelta(days=rnd.randint(-30, 30)), task_description='Synthetic task'))
+    _insert(db, app_module.LeaveRequest, leaves); _insert(db, app_module.PersonalTask, tasks)
+    _insert(db, app_module.Announcement, [dict(content=f'Announcement {i}', user_id=1) for i in range(20)])
+
+    app_module.upgrade_schema()
+    return {'hr': 'HR-0001', 'main_supervisor': app_module.MAIN_SUPERVISOR_ID, 'supervisor': 'SUP-000000', 'employee': 'EMP-000000',
+            'employees': len(users), 'password': BENCH_PASSWORD}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', default='small', help='small (100), medium (10k), large (100k) or a number')
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--leaves-per-year', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database', default=None, help='SQLAlchemy URL; its tables are dropped (default: a SQLite file per scale in the temp dir)')
+    args = parser.parse_args()
+    employees = SCALES.get(args.employees) or int(args.employees)
+    os.environ['DATABASE_URL'] = args.database or f"sqlite:///{os.path.join(tempfile.gettempdir(), f'hr-payroll-bench-{employees}.db')}"
+    import app as app_module
+    with app_module.app.app_context():
+        info = generate(app_module, employees, args.years, args.leaves_per_year, args.seed)
+    print(f"Generated {info['employees']} users into {app_module.app.config['SQLALCHEMY_DATABASE_URI']}")
+
+
+if __name__ == '__main__':
+    main()
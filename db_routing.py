@@ -0,0 +1,74 @@
+import os
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+
+# Bind key of the optional read replica in SQLALCHEMY_BINDS
+REPLICA_BIND = 'replica'
+
+
+def engine_options(url, prefix='DB_'):
+    """
+    Connection-pool settings for one engine, read from the environment
+    (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING).
+    Each gunicorn worker holds its own pool, so the database sees up to
+    workers x (pool size + overflow) connections per engine.
+    """
+    options = {
+        'pool_pre_ping': os.environ.get(f'{prefix}POOL_PRE_PING', '1').lower() not in ('0', 'false', 'no'),
+        'pool_recycle': int(os.environ.get(f'{prefix}POOL_RECYCLE', 1800)),
+    }
+    # In-memory SQLite uses a single shared connection; sizing only applies to queued pools
+    url = make_url(url)
+    if not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')):
+        options.update(pool_size=int(os.environ.get(f'{prefix}POOL_SIZE', 5)), max_overflow=int(os.environ.get(f'{prefix}MAX_OVERFLOW', 10)),
+                       pool_timeout=int(os.environ.get(f'{prefix}POOL_TIMEOUT', 30)))
+    return options
+
+
+def use_replica():
+    """
+    Sends db.session reads to the replica for the rest of the app context, i.e. the
+    request (including a streamed response body) or the CLI command.
+    """
+    g._use_replica = True
+
+
+@contextmanager
+def primary_reads():
+    """
+    Sends reads back to the primary inside a use_replica() request, for anything
+    whose result gets stored: data computed from a lagging replica would outlive
+    the invalidation that already ran on the primary. Yields True when reads were
+    switched, i.e. anything loaded earlier in the request may have come from the replica.
+    """
+    previous = g.get('_use_replica') if has_app_context() else None
+    if previous: g._use_replica = False
+    try: yield bool(previous)
+    finally:
+        if previous: g._use_replica = previous
+
+
+class RoutingSession(Session):
+    """
+    db.session that reads from the replica bind once use_replica() has been called.
+    Flushes and bulk INSERT/UPDATE/DELETE statements always go to the primary, so a
+    marked request can still write. Without a replica bind nothing changes.
+    """
+    _executing_dml = False
+
+    def execute(self, statement, *args, **kwargs):
+        # ORM-enabled bulk DML (session.execute(insert(Model), rows)) resolves its connection
+        # from the mapper alone, without the statement, so mark the whole call as a write
+        if not getattr(statement, 'is_dml', False): return super().execute(statement, *args, **kwargs)
+        self._executing_dml = True
+        try: return super().execute(statement, *args, **kwargs)
+        finally: self._executing_dml = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('_use_replica') and not self._flushing and not self._executing_dml and not getattr(clause, 'is_dml', False):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None: return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -0,0 +1,123 @@
+import csv
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from werkzeug.security import generate_password_hash
+
+IMPORT_COLUMNS = ['employee_id', 'name', 'email', 'phone_number', 'address', 'date_of_joining', 'role', 'salary', 'password', 'supervisor_employee_id']
+REQUIRED_COLUMNS = ['employee_id', 'name', 'email', 'date_of_joining', 'salary', 'password']
+ROLES = ['employee', 'supervisor', 'hr']
+IMPORT_BATCH_SIZE = 500
+
+
+def read_import_csv(stream):
+    """Parses an uploaded or on-disk CSV (text or bytes stream) into a list of dicts."""
+    if isinstance(stream, (bytes, bytearray)): stream = io.StringIO(stream.decode('utf-8-sig'))
+    return list(csv.DictReader(stream))
+
+
+def _validate(rows, existing_ids, existing_emails):
+    """Returns (valid rows as User mappings, errors). Uniqueness is checked against the pre-fetched sets."""
+    valid, errors = [], []
+    seen_ids, seen_emails = set(), set()
+    for line, row in enumerate(rows, start=2):  # line 1 is the header
+        row = {key.strip(): (value or '').strip() for key, value in row.items() if key}
+        employee_id = row.get('employee_id', '')
+        missing = [column for column in REQUIRED_COLUMNS if not row.get(column)]
+        if missing:
+            errors.append({'line': line, 'employee_id': employee_id, 'error': f"Missing {', '.join(missing)}."}); continue
+        if employee_id in existing_ids or employee_id in seen_ids:
+            errors.append({'line': line, 'employee_id': employee_id, 'error': 'Employee ID already exists.'}); continue
+        if row['email'] in existing_emails or row['email'] in seen_emails:
+            errors.append({'line': line, 'employee_id': employee_id, 'error': 'Email already exists.'}); continue
+        role = row.get('role') or 'employee'
+        if role not in ROLES:
+            errors.append({'line': line, 'employee_id': employee_id, 'error': f'Unknown role {role}.'}); continue
+        try:
+            date_of_joining = datetime.strptime(row['date_of_joining'], '%Y-%m-%d').date(); salary = float(row['salary'])
+        except ValueError:
+            errors.append({'line': line, 'employee_id': employee_id, 'error': 'Invalid date_of_joining (YYYY-MM-DD) or salary.'}); continue
+        seen_ids.add(employee_id); seen_emails.add(row['email'])
+        valid.append({
+            'line': line, 'employee_id': employee_id, 'name': row['name'], 'email': row['email'],
+            'phone_number': row.get('phone_number'), 'address': row.get('address'), 'date_of_joining': date_of_joining,
+            'role': role, 'salary': salary, 'password': row['password'], 'supervisor_employee_id': row.get('supervisor_employee_id') or None
+        })
+    return valid, errors
+
+
+def _resolve_supervisors(valid, existing_ids):
+    """
+    Returns (accepted rows, errors), with accepted rows ordered so that in-file supervisors
+    come before their reports. A row is rejected when its supervisor is unknown, was
+    itself rejected, or when the in-file supervisor chain loops back on itself.
+    """
+    rows = {row['employee_id']: row for row in valid}
+    status = {}  # employee_id -> None when accepted, else the error
+    order = []  # accepted ids, each after its supervisor
+    for employee_id in rows:
+        # Walk up the in-file chain until it reaches a decided row, an existing user or a problem
+        path, on_path, node = [], set(), employee_id
+        while node not in status:
+            path.append(node); on_path.add(node)
+            reference = rows[node]['supervisor_employee_id']
+            if not reference or reference in existing_ids: status[node] = None; order.append(node)
+            elif reference not in rows: status[node] = f'Unknown supervisor {reference}.'
+            elif reference in on_path:
+                cycle = path[path.index(reference):]
+                for member in cycle: status[member] = f"Reporting cycle {' -> '.join(cycle + [reference])}."
+            else: node = reference
+        # Rows below the deciding one share its outcome
+        for member in reversed(path):
+            if member in status: continue
+            supervisor = rows[member]['supervisor_employee_id']
+            status[member] = None if status[supervisor] is None else f'Supervisor {supervisor} was rejected.'
+            if status[member] is None: order.append(member)
+    accepted = [rows[employee_id] for employee_id in order]
+    errors = [{'line': row['line'], 'employee_id': row['employee_id'], 'error': status[row['employee_id']]} for row in valid if status[row['employee_id']] is not None]
+    return accepted, errors
+
+
+def import_employees(rows, db, User, workers=None):
+    """
+    Bulk-creates users from CSV rows. Passwords are hashed across a process pool,
+    supervisors are resolved in memory (existing users or rows in the same file),
+    and rows are inserted with bulk mappings, one transaction per IMPORT_BATCH_SIZE rows.
+    Returns (imported employee_ids, supervisors before their reports; per-row errors).
+    """
+    # --- 1. Validate every row against one pre-fetched set of ids and emails ---
+    existing = db.session.query(User.employee_id, User.email, User.id).all()
+    existing_ids = {row[0]: row[2] for row in existing}; existing_emails = {row[1] for row in existing}
+    valid, errors = _validate(rows, existing_ids, existing_emails)
+
+    # --- 2. Supervisors must be an existing user or another accepted row in this file ---
+    accepted, supervisor_errors = _resolve_supervisors(valid, existing_ids)
+    errors += supervisor_errors; in_file = {row['employee_id'] for row in accepted}
+    if not accepted:
+        return [], sorted(errors, key=lambda e: e['line'])
+
+    # --- 3. Hash passwords in parallel; generate_password_hash is deliberately slow ---
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        hashes = list(pool.map(generate_password_hash, [row['password'] for row in accepted], chunksize=16))
+
+    # --- 4. Insert in batched transactions, pointing at already-existing supervisors first ---
+    columns = ['employee_id', 'name', 'email', 'phone_number', 'address', 'date_of_joining', 'role', 'salary']
+    for start in range(0, len(accepted), IMPORT_BATCH_SIZE):
+        mappings = [dict({column: row[column] for column in columns}, password_hash=password_hash, supervisor_id=existing_ids.get(row['supervisor_employee_id']))
+                    for row, password_hash in zip(accepted[start:start + IMPORT_BATCH_SIZE], hashes[start:start + IMPORT_BATCH_SIZE])]
+        db.session.bulk_insert_mappings(User, mappings); db.session.commit()
+
+    # --- 5. Link rows whose supervisor was created by this import ---
+    pending = [row for row in accepted if row['supervisor_employee_id'] in in_file]
+    if pending:
+        new_ids = {}
+        imported_ids = [row['employee_id'] for row in accepted]
+        for start in range(0, len(imported_ids), IMPORT_BATCH_SIZE):
+            new_ids.update(db.session.query(User.employee_id, User.id).filter(User.employee_id.in_(imported_ids[start:start + IMPORT_BATCH_SIZE])).all())
+        for start in range(0, len(pending), IMPORT_BATCH_SIZE):
+            db.session.bulk_update_mappings(User, [{'id': new_ids[row['employee_id']], 'supervisor_id': new_ids[row['supervisor_employee_id']]}
+                                                   for row in pending[start:start + IMPORT_BATCH_SIZE]])
+            db.session.commit()
+    return [row['employee_id'] for row in accepted], sorted(errors, key=lambda e: e['line'])
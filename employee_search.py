@@ -0,0 +1,89 @@
+import base64
+import json
+
+from flask import current_app
+from sqlalchemy import or_, text, tuple_
+
+# Trigram indexes cannot serve needles shorter than this; those fall back to ILIKE
+MIN_INDEXED_LENGTH = 3
+
+SQLITE_SETUP = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(name, employee_id, content='user', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS user_search_ai AFTER INSERT ON user BEGIN "
+    "INSERT INTO user_search(rowid, name, employee_id) VALUES (new.id, new.name, new.employee_id); END",
+    "CREATE TRIGGER IF NOT EXISTS user_search_ad AFTER DELETE ON user BEGIN "
+    "INSERT INTO user_search(user_search, rowid, name, employee_id) VALUES ('delete', old.id, old.name, old.employee_id); END",
+    "CREATE TRIGGER IF NOT EXISTS user_search_au AFTER UPDATE OF name, employee_id ON user BEGIN "
+    "INSERT INTO user_search(user_search, rowid, name, employee_id) VALUES ('delete', old.id, old.name, old.employee_id); "
+    "INSERT INTO user_search(rowid, name, employee_id) VALUES (new.id, new.name, new.employee_id); END",
+    "INSERT INTO user_search(user_search) VALUES ('rebuild')",
+]
+
+POSTGRES_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    'CREATE INDEX IF NOT EXISTS ix_user_name_trgm ON "user" USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_user_employee_id_trgm ON "user" USING gin (employee_id gin_trgm_ops)',
+]
+
+_fts_available = {}
+
+
+def setup_search_index(db):
+    """
+    Creates the employee search index: an FTS5 trigram table kept in sync by
+    triggers on SQLite, pg_trgm GIN indexes on Postgres. Other databases use the
+    plain ILIKE fallback. Safe to run repeatedly.
+    """
+    dialect = db.engine.dialect.name
+    statements = SQLITE_SETUP if dialect == 'sqlite' else POSTGRES_SETUP if dialect == 'postgresql' else []
+    try:
+        with db.engine.begin() as connection:
+            for statement in statements: connection.execute(text(statement))
+    except Exception as error:  # e.g. SQLite built without FTS5, or no rights to create the extension
+        current_app.logger.warning('Employee search index not created (%s); searches will use ILIKE.', error)
+    _fts_available.pop(db.engine.url, None)
+
+
+def _has_fts(db):
+    # Probed on the primary engine: db.session would read the replica inside read_replica views
+    if db.engine.url not in _fts_available:
+        if db.engine.dialect.name != 'sqlite': _fts_available[db.engine.url] = False
+        else:
+            with db.engine.connect() as connection:
+                _fts_available[db.engine.url] = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'user_search'")).first() is not None
+    return _fts_available[db.engine.url]
+
+
+def search_filter(db, User, search_query):
+    """Criterion matching search_query anywhere in the name or employee ID, served by the index where possible."""
+    if len(search_query) >= MIN_INDEXED_LENGTH and _has_fts(db):
+        needle = '"' + search_query.replace('"', '""') + '"'
+        return User.id.in_(text("SELECT rowid FROM user_search WHERE user_search MATCH :needle").bindparams(needle=needle))
+    # pg_trgm GIN indexes serve ILIKE '%q%' directly on Postgres
+    return or_(User.name.ilike(f'%{search_query}%'), User.employee_id.ilike(f'%{search_query}%'))
+
+
+def encode_cursor(name, user_id):
+    return base64.urlsafe_b64encode(json.dumps([name, user_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        name, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return None
+    # Anything else would reach the database as a bound parameter
+    if not isinstance(name, str) or type(user_id) is not int: return None
+    return name, user_id
+
+
+def keyset_page(query, User, cursor, per_page):
+    """
+    One page of `query` ordered by (name, id), starting after `cursor`.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if position: query = query.filter(tuple_(User.name, User.id) > tuple_(*position))
+    rows = query.order_by(User.name, User.id).limit(per_page + 1).all()
+    next_cursor = encode_cursor(rows[per_page - 1].name, rows[per_page - 1].id) if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
@@ -0,0 +1,171 @@
+import calendar
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from workcalendar import WorkingDayCalendar
+import org_hierarchy
+
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 36
+MAX_SCENARIOS = 10
+# Months of approved-leave history that set each employee's projected leave rate
+HISTORY_MONTHS = 12
+ROLES = ('employee', 'supervisor', 'hr')
+
+
+def parse_month(value):
+    """'YYYY-MM' -> (year, month); raises ValueError with a message fit for the user."""
+    try:
+        parsed = datetime.strptime(str(value), '%Y-%m'); return parsed.year, parsed.month
+    except ValueError:
+        raise ValueError(f'"{value}" is not a month; use YYYY-MM.')
+
+
+def _shift(year, month, offset):
+    index = year * 12 + month - 1 + offset
+    return index // 12, index % 12 + 1
+
+
+def _month_bounds(months):
+    starts = np.array([date(y, m, 1) for y, m in months], dtype='datetime64[D]')
+    ends = np.array([date(y, m, calendar.monthrange(y, m)[1]) for y, m in months], dtype='datetime64[D]')
+    return starts, ends
+
+
+def _leave_rows(db, LeaveRequest, first, last):
+    return db.session.query(LeaveRequest.user_id, LeaveRequest.start_date, LeaveRequest.end_date).filter(
+        LeaveRequest.status == 'Approved', LeaveRequest.start_date <= last, LeaveRequest.end_date >= first).all()
+
+
+def _leave_arrays(rows, position):
+    rows = [row for row in rows if row[0] in position]
+    owners = np.array([position[row[0]] for row in rows], dtype=np.int64)
+    return owners, np.array([row[1] for row in rows], dtype='datetime64[D]'), np.array([row[2] for row in rows], dtype='datetime64[D]')
+
+
+def _booked_days(work_calendar, leaves, month_starts, month_ends, employee_count):
+    """Employee x month matrix of payable days already covered by approved leave."""
+    owners, starts, ends = leaves
+    booked = np.zeros((employee_count, len(month_starts)))
+    if len(owners):
+        # Leaves x months overlap, clipped to each month, counted on the scenario's calendar
+        counts = work_calendar.payable_days_many(np.maximum(starts[:, None], month_starts[None, :]), np.minimum(ends[:, None], month_ends[None, :]))
+        np.add.at(booked, owners, counts)
+    return booked
+
+
+def _validate(scenario, months, supervisor_ids):
+    if not isinstance(scenario, dict): raise ValueError('Each scenario must be an object.')
+    first, last = months[0], months[-1]
+    raises = []
+    for item in scenario.get('raises') or []:
+        try: percent = float(item['percent'])
+        except (KeyError, TypeError, ValueError): raise ValueError('Every raise needs a numeric "percent".')
+        if not -100 < percent <= 1000: raise ValueError('Raise percentages must be above -100 and at most 1000.')
+        role, team = item.get('role') or None, item.get('team') or None
+        if role and role not in ROLES: raise ValueError(f'Unknown role "{role}".')
+        if team is not None:
+            try: team = int(team)
+            except (TypeError, ValueError): raise ValueError('"team" must be a supervisor id.')
+            if team not in supervisor_ids: raise ValueError(f'User {team} is not a supervisor.')
+        effective = parse_month(item['from']) if item.get('from') else first
+        raises.append((percent, role, team, max(effective, first)))
+    holidays = []
+    for value in scenario.get('extra_holidays') or []:
+        try: day = datetime.strptime(str(value), '%Y-%m-%d').date()
+        except ValueError: raise ValueError(f'"{value}" is not a date; use YYYY-MM-DD.')
+        if date(*first, 1) <= day <= date(*last, calendar.monthrange(*last)[1]): holidays.append(day)
+    try: leave_rate = float(scenario.get('leave_rate', 1.0))
+    except (TypeError, ValueError): raise ValueError('"leave_rate" must be a number.')
+    if leave_rate < 0: raise ValueError('"leave_rate" cannot be negative.')
+    return {'name': str(scenario.get('name') or 'Scenario'), 'raises': raises, 'extra_holidays': holidays, 'leave_rate': leave_rate}
+
+
+def payroll_forecast(scenarios, start, month_count, db, User, LeaveRequest, UserHierarchy, work_calendar, today=None):
+    """
+    Prices the payroll for `month_count` months from `start` ('YYYY-MM', default next
+    month) under a baseline and each scenario. A scenario is a dict with an optional
+    name, raises ([{percent, role | team, from}]), extra_holidays (['YYYY-MM-DD'])
+    and leave_rate (multiplier on each employee's historical leave rate).
+
+    Everything is computed on employee x month arrays: salaries from User, payable
+    days from the working-day calendar, and leave days as the larger of the leave
+    already approved for the month and the employee's rate over the last
+    HISTORY_MONTHS months. Deductions follow calculate_payslip. Raises ValueError
+    for an invalid request.
+    """
+    today = today or date.today()
+    try: month_count = int(month_count)
+    except (TypeError, ValueError): raise ValueError('"months" must be a number.')
+    if not 1 <= month_count <= MAX_MONTHS: raise ValueError(f'Forecasts cover 1 to {MAX_MONTHS} months.')
+    if not isinstance(scenarios, list): raise ValueError('"scenarios" must be a list.')
+    if len(scenarios) > MAX_SCENARIOS: raise ValueError(f'At most {MAX_SCENARIOS} scenarios per forecast.')
+    first = parse_month(start) if start else _shift(today.year, today.month, 1)
+    months = [_shift(*first, offset) for offset in range(month_count)]
+    supervisor_ids = {row[0] for row in db.session.query(User.id).filter(User.role == 'supervisor').all()}
+    scenarios = [_validate({'name': 'Baseline'}, months, supervisor_ids)] + [_validate(s, months, supervisor_ids) for s in scenarios]
+
+    # --- 1. Employee vectors ---
+    employees = db.session.query(User.id, User.salary, User.role, User.date_of_joining).order_by(User.id).all()
+    position = {row.id: i for i, row in enumerate(employees)}
+    salary = np.array([row.salary or 0.0 for row in employees], dtype=np.float64)
+    roles = np.array([row.role for row in employees], dtype=object)
+    joined = np.array([row.date_of_joining for row in employees], dtype='datetime64[D]')
+    month_starts, month_ends = _month_bounds(months)
+    month_keys = np.array([y * 12 + m for y, m in months])
+    # Nobody is paid for months that end before they join
+    employed = joined[:, None] <= month_ends[None, :]
+
+    # --- 2. Historical leave rate: payable leave days per payable day employed ---
+    history_last = date(today.year, today.month, 1) - timedelta(days=1)
+    history_first = date(*_shift(today.year, today.month, -HISTORY_MONTHS), 1)
+    owners, starts, ends = _leave_arrays(_leave_rows(db, LeaveRequest, history_first, history_last), position)
+    taken = np.zeros(len(employees))
+    if len(owners):
+        np.add.at(taken, owners, work_calendar.payable_days_many(np.maximum(starts, np.datetime64(history_first)), np.minimum(ends, np.datetime64(history_last))))
+    exposure = work_calendar.payable_days_many(np.maximum(joined, np.datetime64(history_first)), np.full(len(employees), np.datetime64(history_last)))
+    fleet_rate = taken.sum() / exposure.sum() if exposure.sum() else 0.0
+    rate = np.where(exposure > 0, taken / np.maximum(exposure, 1), fleet_rate)
+
+    # --- 3. Leave already approved inside the horizon ---
+    booked_leaves = _leave_arrays(_leave_rows(db, LeaveRequest, date(*first, 1), date(*months[-1], calendar.monthrange(*months[-1])[1])), position)
+    base_payable = np.array([work_calendar.month_payable_days(y, m) for y, m in months], dtype=np.float64)
+    base_booked = _booked_days(work_calendar, booked_leaves, month_starts, month_ends, len(employees))
+    teams = {}
+
+    # --- 4. Price each scenario ---
+    results = []
+    for scenario in scenarios:
+        payable, booked = base_payable, base_booked
+        if scenario['extra_holidays']:
+            scenario_calendar = WorkingDayCalendar(list(work_calendar.holidays) + [(day, 'Scenario holiday', 'scenario') for day in scenario['extra_holidays']])
+            payable = np.array([scenario_calendar.month_payable_days(y, m) for y, m in months], dtype=np.float64)
+            booked = _booked_days(scenario_calendar, booked_leaves, month_starts, month_ends, len(employees))
+        multiplier = np.ones((len(employees), len(months)))
+        for percent, role, team, effective in scenario['raises']:
+            selected = np.ones(len(employees), dtype=bool)
+            if role: selected &= roles == role
+            if team is not None:
+                if team not in teams:
+                    members = [row[0] for row in db.session.execute(org_hierarchy.descendants_query(db, UserHierarchy, team)).all()]
+                    teams[team] = np.zeros(len(employees), dtype=bool); teams[team][[position[m] for m in members if m in position]] = True
+                selected &= teams[team]
+            from_index = int(np.searchsorted(month_keys, effective[0] * 12 + effective[1]))
+            multiplier[selected, from_index:] *= 1 + percent / 100
+        gross = salary[:, None] * multiplier * employed
+        leave_days = np.minimum(np.maximum(booked, rate[:, None] * scenario['leave_rate'] * payable[None, :]), payable[None, :]) * employed
+        per_day = np.divide(gross, payable[None, :], out=np.zeros_like(gross), where=payable[None, :] > 0)
+        deductions = leave_days * per_day
+        # A month with no payable days pays nothing, as in calculate_payslip
+        net = np.where(payable[None, :] > 0, gross - deductions, 0.0)
+        results.append({
+            'name': scenario['name'],
+            'monthly': {'gross': np.round(gross.sum(axis=0), 2).tolist(), 'deductions': np.round(deductions.sum(axis=0), 2).tolist(),
+                        'net': np.round(net.sum(axis=0), 2).tolist(), 'leave_days': np.round(leave_days.sum(axis=0), 1).tolist(), 'payable_days': payable.astype(int).tolist()},
+            'total': {'gross': round(float(gross.sum()), 2), 'deductions': round(float(deductions.sum()), 2), 'net': round(float(net.sum()), 2)},
+            'net_by_role': {role: round(float(net[roles == role].sum()), 2) for role in ROLES if (roles == role).any()},
+        })
+    for result in results: result['net_change'] = round(result['total']['net'] - results[0]['total']['net'], 2)
+    return {'months': [f'{y}-{m:02d}' for y, m in months], 'labels': [date(y, m, 1).strftime('%B %Y') for y, m in months],
+            'employees': len(employees), 'baseline': results[0], 'scenarios': results[1:]}
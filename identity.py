@@ -0,0 +1,60 @@
+from flask_login import UserMixin
+
+PRINCIPAL_FIELDS = ['id', 'employee_id', 'name', 'email', 'phone_number', 'address', 'role', 'salary', 'supervisor_id', 'date_of_joining']
+
+
+class Principal(UserMixin):
+    """
+    Read-only stand-in for the logged-in User, built from a cached snapshot.
+    Carries what templates and permission checks read on every request, including
+    the ids of everyone in the user's reporting subtree, so none of them touch the users table.
+    Load the real User row for anything that writes (e.g. changing a password).
+    """
+    __slots__ = PRINCIPAL_FIELDS + ['team_ids']
+
+    def __init__(self, data):
+        for field in PRINCIPAL_FIELDS: object.__setattr__(self, field, data[field])
+        object.__setattr__(self, 'team_ids', frozenset(data['team_ids']))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Principal is read-only; load the User row to make changes.')
+
+    def __repr__(self):
+        return f'<Principal {self.employee_id}>'
+
+
+def principal_data(user, team_ids):
+    """The cacheable (plain-data) form of a principal."""
+    data = {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+    data['team_ids'] = list(team_ids)
+    return data
+
+
+class PrincipalCache:
+    """
+    Principals keyed by user id in the shared cache, with a TTL and explicit invalidation.
+    `namespace` scopes the keys to one database, since a cache store (e.g. a
+    FileSystemCache directory, which ignores CACHE_KEY_PREFIX) may be shared by apps on other databases.
+    """
+
+    def __init__(self, cache, loader, timeout=300, namespace=''):
+        # loader(user_id) -> principal_data(...) or None when the user does not exist
+        self._cache = cache
+        self._loader = loader
+        self.timeout = timeout
+        self.namespace = namespace
+
+    def key(self, user_id):
+        return f'principal:{self.namespace}:{user_id}'
+
+    def get(self, user_id):
+        data = self._cache.get(self.key(user_id))
+        if data is None:
+            data = self._loader(user_id)
+            if data is None: return None
+            self._cache.set(self.key(user_id), data, timeout=self.timeout)
+        return Principal(data)
+
+    def invalidate(self, *user_ids):
+        keys = [self.key(user_id) for user_id in user_ids if user_id is not None]
+        if keys: self._cache.delete_many(*keys)
@@ -0,0 +1,128 @@
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import Response, abort, current_app, g, has_request_context, request
+from sqlalchemy import event
+
+# Prometheus-style latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Expanded IN lists and literals collapse so "same query, different id" share one shape
+_IN_LIST = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)|\((?:\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement):
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('(?)', statement)).strip()
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0; self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound: self.counts[i] += 1
+        self.total += 1; self.sum += value
+
+
+class RequestMetrics:
+    """
+    Per-endpoint request latency, SQL statement counts and DB time, collected from
+    Flask request hooks and SQLAlchemy engine events and exposed at /metrics.
+    A statement shape repeated N_PLUS_ONE_THRESHOLD times in one request is
+    counted (and logged) as a likely N+1; requests slower than SLOW_REQUEST_MS are
+    logged with their statements. Metrics are per process.
+
+    /metrics needs `Authorization: Bearer <METRICS_TOKEN>`; without a token it is
+    served only when `allow()` (e.g. "the user is HR") returns True, and denied otherwise.
+    """
+
+    def __init__(self, app=None, db=None, allow=None):
+        self._lock = threading.Lock()
+        self.latency = {}; self.queries = {}; self.db_seconds = Counter(); self.n_plus_one = Counter(); self.responses = Counter()
+        self._allow = allow
+        if app is not None: self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('N_PLUS_ONE_THRESHOLD', 5)
+        app.config.setdefault('SLOW_REQUEST_MS', 0)  # 0 disables the slow-request log
+        app.config.setdefault('METRICS_TOKEN', None)
+        app.before_request(self._start_request)
+        app.teardown_request(self._finish_request)
+        with app.app_context():
+            for engine in set(db.engines.values()):
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+
+    # --- Collection ---
+
+    def _start_request(self):
+        g._metrics_started = time.perf_counter(); g._metrics_statements = []
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and hasattr(g, '_metrics_statements'):
+            context._metrics_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is not None and has_request_context() and hasattr(g, '_metrics_statements'):
+            g._metrics_statements.append((statement, time.perf_counter() - started))
+
+    def _finish_request(self, error=None):
+        started = g.pop('_metrics_started', None); statements = g.pop('_metrics_statements', None)
+        if started is None or request.endpoint == 'metrics': return
+        elapsed = time.perf_counter() - started; endpoint = request.endpoint or 'unmatched'
+        db_time = sum(duration for _, duration in statements)
+        shapes = Counter(statement_shape(statement) for statement, _ in statements)
+        repeated = {shape: count for shape, count in shapes.items() if count >= current_app.config['N_PLUS_ONE_THRESHOLD']}
+        with self._lock:
+            self.latency.setdefault(endpoint, _Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.queries.setdefault(endpoint, _Histogram(QUERY_COUNT_BUCKETS)).observe(len(statements))
+            self.db_seconds[endpoint] += db_time
+            self.responses[(endpoint, 'error' if error else 'ok')] += 1
+            if repeated: self.n_plus_one[endpoint] += 1
+        for shape, count in repeated.items():
+            current_app.logger.warning('Possible N+1 in %s: %d x %s', endpoint, count, shape[:300])
+        slow_ms = current_app.config['SLOW_REQUEST_MS']
+        if slow_ms and elapsed * 1000 >= slow_ms:
+            lines = '\n'.join(f'  {duration * 1000:8.2f} ms  {_WHITESPACE.sub(" ", statement)[:500]}' for statement, duration in statements[:50])
+            current_app.logger.warning('Slow request %s %s: %.0f ms, %d statements, %.0f ms in DB\n%s', request.method, request.path, elapsed * 1000, len(statements), db_time * 1000, lines)
+
+    # --- Exposition ---
+
+    def metrics_view(self):
+        token = current_app.config['METRICS_TOKEN']
+        if token: allowed = request.headers.get('Authorization') == f'Bearer {token}'
+        else: allowed = self._allow is not None and self._allow()
+        if not allowed: abort(403)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += self._histogram_lines('http_request_duration_seconds', 'Request latency by endpoint.', self.latency)
+            lines += self._histogram_lines('http_request_sql_statements', 'SQL statements executed per request.', self.queries)
+            lines += ['# HELP http_request_db_seconds_total Time spent executing SQL, by endpoint.', '# TYPE http_request_db_seconds_total counter']
+            lines += [f'http_request_db_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}' for endpoint, seconds in sorted(self.db_seconds.items())]
+            lines += ['# HELP http_request_n_plus_one_total Requests that repeated one statement shape N_PLUS_ONE_THRESHOLD or more times.', '# TYPE http_request_n_plus_one_total counter']
+            lines += [f'http_request_n_plus_one_total{{endpoint="{endpoint}"}} {count}' for endpoint, count in sorted(self.n_plus_one.items())]
+            lines += ['# HELP http_requests_total Requests by endpoint and outcome.', '# TYPE http_requests_total counter']
+            lines += [f'http_requests_total{{endpoint="{endpoint}",outcome="{outcome}"}} {count}' for (endpoint, outcome), count in sorted(self.responses.items())]
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _histogram_lines(name, help_text, histograms):
+        lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for endpoint, histogram in sorted(histograms.items()):
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {histogram.total}')
+            lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{{endpoint="{endpoint}"}} {histogram.total}')
+        return lines
@@ -0,0 +1,108 @@
+import bisect
+import threading
+from array import array
+from datetime import date
+
+# Leaves longer than this are kept in a small side list so the main index can
+# bound its search window by LONG_LEAVE_DAYS instead of by the longest leave ever taken.
+LONG_LEAVE_DAYS = 31
+
+
+class LeaveIntervalIndex:
+    """
+    Sorted-endpoint index of approved leaves. Entries are kept ordered by start
+    date; an overlap query for [a, b] only looks at leaves starting in
+    [a - LONG_LEAVE_DAYS, b] plus the long-leave list, so its cost grows with the
+    number of results rather than with the whole leave history.
+    """
+
+    def __init__(self, leaves=()):
+        # leaves: iterable of (leave_id, user_id, start_date, end_date)
+        self._starts = array('l'); self._ends = array('l'); self._ids = array('l'); self._users = array('l')
+        self._long = {}
+        for leave_id, user_id, start, end in sorted(leaves, key=lambda l: (l[2].toordinal(), l[0])):
+            if (end - start).days >= LONG_LEAVE_DAYS: self._long[leave_id] = (user_id, start.toordinal(), end.toordinal())
+            else:
+                self._starts.append(start.toordinal()); self._ends.append(end.toordinal())
+                self._ids.append(leave_id); self._users.append(user_id)
+
+    def copy(self):
+        clone = LeaveIntervalIndex()
+        clone._starts, clone._ends, clone._ids, clone._users = array('l', self._starts), array('l', self._ends), array('l', self._ids), array('l', self._users)
+        clone._long = dict(self._long)
+        return clone
+
+    def __len__(self):
+        return len(self._ids) + len(self._long)
+
+    def add(self, leave_id, user_id, start, end):
+        self.remove(leave_id)
+        if (end - start).days >= LONG_LEAVE_DAYS:
+            self._long[leave_id] = (user_id, start.toordinal(), end.toordinal()); return
+        i = bisect.bisect_right(self._starts, start.toordinal())
+        self._starts.insert(i, start.toordinal()); self._ends.insert(i, end.toordinal())
+        self._ids.insert(i, leave_id); self._users.insert(i, user_id)
+
+    def remove(self, leave_id):
+        if self._long.pop(leave_id, None) is not None: return
+        try: i = self._ids.index(leave_id)
+        except ValueError: return
+        for column in (self._starts, self._ends, self._ids, self._users): del column[i]
+
+    def remove_user(self, user_id):
+        for leave_id in [leave_id for leave_id, entry in self._long.items() if entry[0] == user_id]: del self._long[leave_id]
+        keep = [i for i, owner in enumerate(self._users) if owner != user_id]
+        if len(keep) != len(self._users):
+            self._starts, self._ends, self._ids, self._users = (array('l', (column[i] for i in keep)) for column in (self._starts, self._ends, self._ids, self._users))
+
+    def overlapping(self, start=None, end=None, user_ids=None):
+        """
+        Approved leaves overlapping [start, end] (inclusive; open-ended when None),
+        optionally limited to `user_ids`, as (leave_id, user_id, start_date, end_date).
+        """
+        lo = start.toordinal() if start else None; hi = end.toordinal() if end else None
+        first = 0 if lo is None else bisect.bisect_left(self._starts, lo - LONG_LEAVE_DAYS)
+        last = len(self._starts) if hi is None else bisect.bisect_right(self._starts, hi)
+        results = []
+        for i in range(first, last):
+            if (lo is None or self._ends[i] >= lo) and (user_ids is None or self._users[i] in user_ids):
+                results.append((self._ids[i], self._users[i], date.fromordinal(self._starts[i]), date.fromordinal(self._ends[i])))
+        for leave_id, (user_id, leave_start, leave_end) in self._long.items():
+            if (lo is None or leave_end >= lo) and (hi is None or leave_start <= hi) and (user_ids is None or user_id in user_ids):
+                results.append((leave_id, user_id, date.fromordinal(leave_start), date.fromordinal(leave_end)))
+        return results
+
+    def count_overlapping(self, start, end):
+        return len(self.overlapping(start, end))
+
+
+class LeaveIndexService:
+    """
+    Hands out the process-wide LeaveIntervalIndex. Local mutations are applied
+    incrementally to a copy that then replaces the shared index, so readers never
+    see a half-applied change; a data version moved by another worker triggers a rebuild.
+    """
+
+    def __init__(self, loader, version_getter):
+        self._loader = loader
+        self._version_getter = version_getter
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        version = self._version_getter()
+        with self._lock:
+            if self._index is None or version != self._version:
+                self._index = LeaveIntervalIndex(self._loader())
+                self._version = version
+            return self._index
+
+    def apply(self, new_version, change):
+        """Apply `change(index)` for a committed mutation that moved the version to `new_version`."""
+        with self._lock:
+            if self._index is not None and self._version == new_version - 1:
+                index = self._index.copy(); change(index)
+                self._index = index; self._version = new_version
+            else:
+                self._index = None
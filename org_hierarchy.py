@@ -0,0 +1,74 @@
+from sqlalchemy import and_, exists
+
+# Closure-table maintenance for User.supervisor_id. UserHierarchy holds one row per
+# (ancestor, descendant) pair, including each user's own depth-0 row, so "everyone
+# under X" and "is X above Y" are single indexed lookups instead of tree walks.
+
+INSERT_BATCH_SIZE = 1000
+
+
+def rebuild_hierarchy(db, User, UserHierarchy):
+    """Recomputes the whole closure table from User.supervisor_id."""
+    parents = dict(db.session.query(User.id, User.supervisor_id).all())
+    rows = []
+    for user_id in parents:
+        depth, node, seen = 0, user_id, set()
+        while node is not None and node in parents and node not in seen:
+            rows.append({'ancestor_id': node, 'descendant_id': user_id, 'depth': depth})
+            seen.add(node); node = parents[node]; depth += 1
+    UserHierarchy.query.delete(synchronize_session=False)
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.bulk_insert_mappings(UserHierarchy, rows[i:i + INSERT_BATCH_SIZE])
+
+
+def ancestor_ids(db, UserHierarchy, user_id):
+    """Everyone above user_id, nearest first."""
+    return [row[0] for row in db.session.query(UserHierarchy.ancestor_id).filter(
+        UserHierarchy.descendant_id == user_id, UserHierarchy.depth > 0).order_by(UserHierarchy.depth).all()]
+
+
+def descendants_query(db, UserHierarchy, user_id):
+    """Subquery of the ids of everyone under user_id, for use in IN (...) filters."""
+    return db.select(UserHierarchy.descendant_id).where(UserHierarchy.ancestor_id == user_id, UserHierarchy.depth > 0)
+
+
+def manages(db, UserHierarchy, manager_id, user_id):
+    """True if manager_id is above user_id at any depth."""
+    return db.session.query(exists().where(and_(
+        UserHierarchy.ancestor_id == manager_id, UserHierarchy.descendant_id == user_id, UserHierarchy.depth > 0))).scalar()
+
+
+def add_user(db, UserHierarchy, user_id, supervisor_id):
+    """Adds the rows for a newly created user (flush first so user_id is set)."""
+    rows = [{'ancestor_id': user_id, 'descendant_id': user_id, 'depth': 0}]
+    if supervisor_id is not None:
+        rows += [{'ancestor_id': ancestor, 'descendant_id': user_id, 'depth': depth + 1}
+                 for ancestor, depth in db.session.query(UserHierarchy.ancestor_id, UserHierarchy.depth).filter(UserHierarchy.descendant_id == supervisor_id).all()]
+    db.session.bulk_insert_mappings(UserHierarchy, rows)
+
+
+def move_user(db, UserHierarchy, user_id, new_supervisor_id):
+    """
+    Re-parents user_id (and everyone under it) below new_supervisor_id, or makes it
+    a root when None. Raises ValueError if that would create a reporting cycle.
+    """
+    subtree = db.session.query(UserHierarchy.descendant_id, UserHierarchy.depth).filter(UserHierarchy.ancestor_id == user_id).all()
+    subtree_ids = [row[0] for row in subtree]
+    if new_supervisor_id is not None and new_supervisor_id in subtree_ids:
+        raise ValueError('A user cannot report to themselves or to someone who reports to them.')
+    # Detach: drop every path from outside the subtree into it
+    UserHierarchy.query.filter(UserHierarchy.descendant_id.in_(subtree_ids), ~UserHierarchy.ancestor_id.in_(subtree_ids)).delete(synchronize_session=False)
+    if new_supervisor_id is None: return
+    # Attach: every ancestor of the new supervisor (itself included) reaches every node of the subtree
+    above = db.session.query(UserHierarchy.ancestor_id, UserHierarchy.depth).filter(UserHierarchy.descendant_id == new_supervisor_id).all()
+    rows = [{'ancestor_id': ancestor, 'descendant_id': descendant, 'depth': ancestor_depth + 1 + descendant_depth}
+            for ancestor, ancestor_depth in above for descendant, descendant_depth in subtree]
+    for i in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.session.bulk_insert_mappings(UserHierarchy, rows[i:i + INSERT_BATCH_SIZE])
+
+
+def remove_user(db, User, UserHierarchy, user_id):
+    """Detaches user_id's direct reports (their teams move with them) and drops user_id's own rows."""
+    for report_id, in db.session.query(User.id).filter(User.supervisor_id == user_id).all():
+        move_user(db, UserHierarchy, report_id, None)
+    UserHierarchy.query.filter((UserHierarchy.ancestor_id == user_id) | (UserHierarchy.descendant_id == user_id)).delete(synchronize_session=False)
@@ -1,38 +1,103 @@
-import pandas as pd
+import calendar
+import numpy as np
 from datetime import date
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from workcalendar import WorkingDayCalendar
+from db_routing import primary_reads
 # We REMOVED the broken import: from .app import db, Holiday, LeaveRequest 
 
 # MODIFIED: The function now accepts the database tools as arguments
-def calculate_payslip(employee, year, month, db, Holiday, LeaveRequest):
+def calculate_payslip(employee, year, month, db, Holiday, LeaveRequest, work_calendar=None):
     """
     Calculates the payslip for a given employee for a specific month and year.
+    Pass the shared WorkingDayCalendar as `work_calendar` to skip the holiday query.
     """
     # --- 1. Define the date range for the month ---
     start_of_month = date(year, month, 1)
-    # pd.to_datetime helps create a timestamp, and .days_in_month gives us the last day
-    end_of_month = date(year, month, pd.to_datetime(start_of_month).days_in_month)
-    month_dates = pd.date_range(start_of_month, end_of_month)
-
-    # --- 2. Get all public holidays for the month ---
-    holidays_query = Holiday.query.filter(
-        db.extract('year', Holiday.date) == year,
-        db.extract('month', Holiday.date) == month
-    ).all()
-    public_holidays = [h.date for h in holidays_query]
+    end_of_month = date(year, month, calendar.monthrange(year, month)[1])
+
+    # --- 2. Get the working-day calendar (public holidays) for the month ---
+    work_calendar = work_calendar or _holiday_calendar(start_of_month, end_of_month, Holiday)
 
     # --- 3. Determine the total number of payable days ---
     # Payable days are days that are NOT a Sunday and NOT a public holiday.
-    payable_days_count = 0
-    for day in month_dates:
-        # day.weekday() returns 6 for Sunday
-        if day.weekday() != 6 and day.date() not in public_holidays:
-            payable_days_count += 1
-            
-    # Avoid division by zero if a month has no working days
+    payable_days_count = work_calendar.month_payable_days(year, month)
+
+    # --- 4. Find approved leaves for the employee overlapping this month ---
+    approved_leaves = db.session.query(LeaveRequest.start_date, LeaveRequest.end_date).filter(
+        LeaveRequest.user_id == employee.id,
+        LeaveRequest.status == 'Approved',
+        LeaveRequest.start_date <= end_of_month,
+        LeaveRequest.end_date >= start_of_month
+    ).all()
+
+    # --- 5. Deduct pay only for leave days inside the month that were payable days ---
+    deductible_leave_days = sum(
+        work_calendar.payable_days(max(leave_start, start_of_month), min(leave_end, end_of_month))
+        for leave_start, leave_end in approved_leaves
+    )
+
+    # --- 6. Calculate deductions and return the payslip data as a dictionary ---
+    return _build_payslip(employee, start_of_month.strftime("%B %Y"), payable_days_count, deductible_leave_days)
+
+
+# Keep IN (...) lists well below the SQLite bound-parameter limit
+BATCH_QUERY_SIZE = 500
+
+
+def _holiday_calendar(first, last, Holiday):
+    """Builds a WorkingDayCalendar from the holidays between two dates (used when no shared calendar is given)."""
+    return WorkingDayCalendar((h.date, h.name, h.type) for h in Holiday.query.filter(Holiday.date >= first, Holiday.date <= last).all())
+
+
+def calculate_payroll_batch(employees, year, month, db, Holiday, LeaveRequest, work_calendar=None):
+    """
+    Calculates payslips for many employees for one month in a single pass.
+    Returns the same dictionaries as calculate_payslip, in the order of `employees`.
+    """
+    employees = list(employees)
+
+    # --- 1. Define the date range for the month ---
+    start_of_month = date(year, month, 1)
+    end_of_month = date(year, month, calendar.monthrange(year, month)[1])
+    month_year = start_of_month.strftime("%B %Y")
+
+    # --- 2. Payable days are the same for every employee ---
+    work_calendar = work_calendar or _holiday_calendar(start_of_month, end_of_month, Holiday)
+    payable_days_count = work_calendar.month_payable_days(year, month)
+
+    # --- 3. Fetch only approved leaves overlapping this month, in batched IN queries ---
+    position = {employee.id: i for i, employee in enumerate(employees)}
+    employee_ids = list(position)
+    leave_rows = []
+    for i in range(0, len(employee_ids), BATCH_QUERY_SIZE):
+        leave_rows.extend(db.session.query(LeaveRequest.user_id, LeaveRequest.start_date, LeaveRequest.end_date).filter(
+            LeaveRequest.user_id.in_(employee_ids[i:i + BATCH_QUERY_SIZE]),
+            LeaveRequest.status == 'Approved',
+            LeaveRequest.start_date <= end_of_month,
+            LeaveRequest.end_date >= start_of_month
+        ).all())
+
+    # --- 4. Count deductible leave days for all leaves at once ---
+    deductible = np.zeros(len(employees), dtype=np.int64)
+    if leave_rows:
+        owners = np.array([position[row[0]] for row in leave_rows], dtype=np.int64)
+        starts = np.maximum(np.array([row[1] for row in leave_rows], dtype='datetime64[D]'), np.datetime64(start_of_month))
+        ends = np.minimum(np.array([row[2] for row in leave_rows], dtype='datetime64[D]'), np.datetime64(end_of_month))
+        np.add.at(deductible, owners, work_calendar.payable_days_many(starts, ends))
+
+    # --- 5. Build the payslip dictionaries ---
+    return [_build_payslip(employee, month_year, payable_days_count, deductible_leave_days)
+            for employee, deductible_leave_days in zip(employees, deductible.tolist())]
+
+
+def _build_payslip(employee, month_year, payable_days_count, deductible_leave_days):
+    """Assembles a payslip dictionary exactly as calculate_payslip returns it."""
     if payable_days_count == 0:
         return {
             "employee_name": employee.name,
-            "month_year": start_of_month.strftime("%B %Y"),
+            "month_year": month_year,
             "gross_salary": employee.salary,
             "total_payable_days": 0,
             "per_day_salary": 0,
@@ -41,42 +106,132 @@ def calculate_payslip(employee, year, month, db, Holiday, LeaveRequest):
             "net_salary": 0,
             "error": "No payable days in this month."
         }
-
-
-    # --- 4. Calculate salary per day ---
     per_day_salary = employee.salary / payable_days_count
-
-    # --- 5. Find approved, deductible leave days for the employee in this month ---
-    approved_leaves_query = LeaveRequest.query.filter(
-        LeaveRequest.user_id == employee.id,
-        LeaveRequest.status == 'Approved'
-    ).all()
-    
-    deductible_leave_days = 0
-    for leave in approved_leaves_query:
-        # Create a date range for each approved leave period
-        leave_dates = pd.date_range(leave.start_date, leave.end_date)
-        for leave_day in leave_dates:
-            # Check if the leave day falls within the current payslip month
-            if leave_day.month == month and leave_day.year == year:
-                # Deduct pay only if the leave day was a payable day
-                if leave_day.weekday() != 6 and leave_day.date() not in public_holidays:
-                    deductible_leave_days += 1
-
-    # --- 6. Calculate deductions and final salary ---
     deductions = deductible_leave_days * per_day_salary
-    net_salary = employee.salary - deductions
-
-    # --- 7. Return the payslip data as a dictionary ---
-    payslip_data = {
+    return {
         "employee_name": employee.name,
-        "month_year": start_of_month.strftime("%B %Y"),
+        "month_year": month_year,
         "gross_salary": employee.salary,
         "total_payable_days": payable_days_count,
         "per_day_salary": per_day_salary,
         "deductible_leave_days": deductible_leave_days,
         "deductions": deductions,
-        "net_salary": net_salary
+        "net_salary": employee.salary - deductions
     }
-    
-    return payslip_data
\ No newline at end of file
+
+
+def _calculate_months(employee, months, db, Holiday, LeaveRequest, work_calendar=None):
+    """
+    Calculates payslips for one employee over several (year, month) pairs using
+    one LeaveRequest query (and at most one Holiday query) for the whole span.
+    """
+    if not months:
+        return {}
+    first = date(*min(months), 1)
+    last_year, last_month = max(months)
+    last = date(last_year, last_month, calendar.monthrange(last_year, last_month)[1])
+
+    work_calendar = work_calendar or _holiday_calendar(first, last, Holiday)
+    leaves = db.session.query(LeaveRequest.start_date, LeaveRequest.end_date).filter(
+        LeaveRequest.user_id == employee.id,
+        LeaveRequest.status == 'Approved',
+        LeaveRequest.start_date <= last,
+        LeaveRequest.end_date >= first
+    ).all()
+    leave_starts = np.array([leave[0] for leave in leaves], dtype='datetime64[D]')
+    leave_ends = np.array([leave[1] for leave in leaves], dtype='datetime64[D]')
+
+    payslips = {}
+    for year, month in months:
+        start_of_month = date(year, month, 1)
+        end_of_month = date(year, month, calendar.monthrange(year, month)[1])
+        deductible = work_calendar.payable_days_many(np.maximum(leave_starts, np.datetime64(start_of_month)), np.minimum(leave_ends, np.datetime64(end_of_month)))
+        payslips[(year, month)] = _build_payslip(employee, start_of_month.strftime("%B %Y"), work_calendar.month_payable_days(year, month), int(deductible.sum()))
+    return payslips
+
+
+# --- Payslip snapshots ---
+# Closed months are stored in PayslipSnapshot and only recomputed after
+# invalidate_payslips() removes them; the current month is always live.
+
+def _is_closed(year, month, today):
+    return (year, month) < (today.year, today.month)
+
+
+def _snapshot_to_payslip(employee, snapshot):
+    payslip = _build_payslip(employee, date(snapshot.year, snapshot.month, 1).strftime("%B %Y"), snapshot.total_payable_days, snapshot.deductible_leave_days)
+    payslip.update(gross_salary=snapshot.gross_salary, per_day_salary=snapshot.per_day_salary, deductions=snapshot.deductions, net_salary=snapshot.net_salary)
+    return payslip
+
+
+def _snapshot_row(employee, year, month, payslip):
+    return dict(
+        user_id=employee.id, year=year, month=month,
+        gross_salary=payslip['gross_salary'], total_payable_days=payslip['total_payable_days'],
+        per_day_salary=payslip['per_day_salary'], deductible_leave_days=payslip['deductible_leave_days'],
+        deductions=payslip['deductions'], net_salary=payslip['net_salary']
+    )
+
+
+def get_payslips(employee, months, db, Holiday, LeaveRequest, PayslipSnapshot, today=None, work_calendar=None):
+    """
+    Returns {(year, month): payslip} for the requested months. Closed months since
+    the employee joined are served from PayslipSnapshot (and stored there on a
+    miss); the open month, and any month before joining, is computed live.
+    """
+    today = today or date.today()
+    months = list(months)
+    joined = (employee.date_of_joining.year, employee.date_of_joining.month)
+    stored = [m for m in months if _is_closed(m[0], m[1], today) and m >= joined]
+    payslips = {}
+    if stored:
+        snapshots = PayslipSnapshot.query.filter_by(user_id=employee.id).all()
+        for snapshot in snapshots:
+            payslips[(snapshot.year, snapshot.month)] = _snapshot_to_payslip(employee, snapshot)
+        missing = [m for m in stored if m not in payslips]
+        if missing:
+            # Stored rows must come from the primary: invalidation only ever runs there
+            with primary_reads() as switched:
+                # ...including the holidays: a shared calendar built on the replica may be behind too
+                computed = _calculate_months(employee, missing, db, Holiday, LeaveRequest, None if switched else work_calendar)
+            # One multi-row INSERT rather than a flush per snapshot; a concurrent request may have
+            # stored the same months first, and its rows are equivalent
+            try:
+                db.session.execute(db.insert(PayslipSnapshot), [_snapshot_row(employee, y, m, p) for (y, m), p in computed.items()]); db.session.commit()
+            except IntegrityError: db.session.rollback()
+            payslips.update(computed)
+    payslips.update(_calculate_months(employee, [m for m in months if m not in payslips], db, Holiday, LeaveRequest, work_calendar))
+    return {m: payslips[m] for m in months}
+
+
+def invalidate_payslips(db, PayslipSnapshot, user_id=None, start=None, end=None):
+    """
+    Drops stored snapshots for one user (or everyone) whose month overlaps
+    [start, end]. Call before committing the change that made them stale.
+    """
+    query = PayslipSnapshot.query
+    if user_id is not None:
+        query = query.filter(PayslipSnapshot.user_id == user_id)
+    period = PayslipSnapshot.year * 12 + PayslipSnapshot.month
+    if start is not None:
+        query = query.filter(period >= start.year * 12 + start.month)
+    if end is not None:
+        query = query.filter(period <= end.year * 12 + end.month)
+    query.delete(synchronize_session=False)
+
+
+def invalidate_payslips_for_leaves(db, PayslipSnapshot, leaves):
+    """
+    invalidate_payslips for many leaves at once: (user_id, start_date, end_date)
+    tuples become one DELETE per INVALIDATE_BATCH_SIZE leaves.
+    """
+    period = PayslipSnapshot.year * 12 + PayslipSnapshot.month
+    leaves = list(leaves)
+    for i in range(0, len(leaves), INVALIDATE_BATCH_SIZE):
+        PayslipSnapshot.query.filter(or_(*[
+            and_(PayslipSnapshot.user_id == user_id, period >= start.year * 12 + start.month, period <= end.year * 12 + end.month)
+            for user_id, start, end in leaves[i:i + INVALIDATE_BATCH_SIZE]
+        ])).delete(synchronize_session=False)
+
+
+INVALIDATE_BATCH_SIZE = 200
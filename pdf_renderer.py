@@ -0,0 +1,123 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# A claim file older than this belongs to a render that died; it is taken over
+STALE_CLAIM_SECONDS = 300
+# Seconds between sweeps of the cache directory for expired files
+PRUNE_INTERVAL = 3600
+
+
+def render_pdf_file(html, path):
+    """Runs in a pool process: render `html` and atomically publish it at `path`."""
+    from weasyprint import HTML
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    HTML(string=html).write_pdf(tmp_path)
+    os.replace(tmp_path, path)
+    return path
+
+
+class PdfRenderer:
+    """
+    Renders HTML to PDF in a small process pool, off the request thread.
+    Output is cached on disk under the SHA-256 of the HTML, so an unchanged
+    document is rendered once and then served straight from the file. Files
+    older than `max_age` seconds are pruned, at most once per PRUNE_INTERVAL.
+    """
+    READY, PENDING, BUSY, FAILED = 'ready', 'pending', 'busy', 'failed'
+
+    def __init__(self, cache_dir, max_workers=2, max_pending=16, max_age=2 * 86400):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.max_age = max_age
+        self._pruned_at = 0
+        self._executor = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, digest):
+        return os.path.join(self.cache_dir, f'{digest}.pdf')
+
+    def _claim(self, digest):
+        # Cross-worker claim, so a retry landing on another gunicorn worker does not render the same letter again
+        claim = self.path_for(digest) + '.claim'
+        try:
+            os.close(os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY)); return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(claim) < STALE_CLAIM_SECONDS: return False
+            except FileNotFoundError: return False
+        # Take over the stale claim by swapping in a fresh file; when several workers race,
+        # the last replace wins and only the worker whose token survives renders
+        token = uuid.uuid4().hex; tmp_path = f'{claim}.{token}.tmp'
+        descriptor = os.open(tmp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        with os.fdopen(descriptor, 'w') as handle: handle.write(token)
+        os.replace(tmp_path, claim)
+        try:
+            with open(claim) as handle: return handle.read() == token
+        except FileNotFoundError: return False
+
+    def _release(self, digest):
+        try: os.remove(self.path_for(digest) + '.claim')
+        except FileNotFoundError: pass
+
+    def _submit(self, html, digest):
+        for attempt in range(2):
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            try:
+                future = self._executor.submit(render_pdf_file, html, self.path_for(digest)); break
+            except BrokenProcessPool:
+                # A pool process died (e.g. OOM-killed); start a fresh pool once
+                self._executor = None
+                if attempt: self._release(digest); raise
+        future.add_done_callback(lambda _: self._release(digest))
+        return future
+
+    def prune(self, now=None):
+        """Deletes rendered letters and leftover temp files older than max_age; returns how many."""
+        now = now or time.time(); removed = 0
+        try: names = os.listdir(self.cache_dir)
+        except FileNotFoundError: return 0
+        for name in names:
+            if name.endswith('.claim'): continue  # released by their render, or taken over once stale
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if now - os.path.getmtime(path) > self.max_age: os.remove(path); removed += 1
+            except FileNotFoundError: pass
+        return removed
+
+    def request(self, html):
+        """
+        Returns (status, path). `path` is set only when status is READY; PENDING
+        and BUSY mean "retry shortly", FAILED means the last render raised.
+        """
+        digest = hashlib.sha256(html.encode('utf-8')).hexdigest()
+        path = self.path_for(digest)
+        if os.path.exists(path): return self.READY, path
+        with self._lock:
+            future = self._pending.get(digest)
+            if future is not None:
+                if not future.done(): return self.PENDING, None
+                del self._pending[digest]
+                if future.exception() is not None: return self.FAILED, None
+                return self.READY, path
+            if len(self._pending) >= self.max_pending:
+                self._pending = {key: f for key, f in self._pending.items() if not f.done()}
+                if len(self._pending) >= self.max_pending: return self.BUSY, None
+            os.makedirs(self.cache_dir, exist_ok=True)
+            if time.time() - self._pruned_at > PRUNE_INTERVAL:
+                self._pruned_at = time.time(); self.prune()
+            if not self._claim(digest): return self.PENDING, None
+            self._pending[digest] = self._submit(html, digest)
+        return self.PENDING, None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True); self._executor = None
@@ -0,0 +1,83 @@
+import bisect
+import calendar
+import threading
+from datetime import date, timedelta
+
+import numpy as np
+
+# Sunday is the only weekly off; the rest of the week is payable
+WEEKMASK = '1111110'
+
+
+class WorkingDayCalendar:
+    """
+    An immutable view of the payable-day rule: not a Sunday and not a public holiday.
+    Built once from the Holiday rows and shared by payroll, the calendar feed and analytics.
+    """
+
+    def __init__(self, holidays=()):
+        # holidays: iterable of (date, name, type)
+        self.holidays = sorted(holidays, key=lambda h: h[0])
+        self._dates = [h[0] for h in self.holidays]
+        self.busdaycal = np.busdaycalendar(weekmask=WEEKMASK, holidays=np.array(self._dates, dtype='datetime64[D]'))
+        self._month_bitmaps = {}
+        self._lock = threading.Lock()
+
+    def payable_days(self, start, end):
+        """Number of payable days in [start, end], both inclusive."""
+        if start > end:
+            return 0
+        return int(np.busday_count(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1, busdaycal=self.busdaycal))
+
+    def payable_days_many(self, starts, ends):
+        """Vectorized payable_days over arrays of inclusive ranges; empty ranges count 0."""
+        starts = np.asarray(starts, dtype='datetime64[D]'); ends = np.asarray(ends, dtype='datetime64[D]') + 1
+        return np.where(starts < ends, np.busday_count(starts, np.maximum(starts, ends), busdaycal=self.busdaycal), 0)
+
+    def month_bitmap(self, year, month):
+        """Boolean array, one entry per day of the month, True on payable days. Memoized."""
+        key = (year, month)
+        bitmap = self._month_bitmaps.get(key)
+        if bitmap is None:
+            first = np.datetime64(date(year, month, 1), 'D')
+            days = first + np.arange(calendar.monthrange(year, month)[1])
+            bitmap = np.is_busday(days, busdaycal=self.busdaycal)
+            bitmap.setflags(write=False)
+            with self._lock:
+                self._month_bitmaps[key] = bitmap
+        return bitmap
+
+    def month_payable_days(self, year, month):
+        return int(self.month_bitmap(year, month).sum())
+
+    def holidays_between(self, start, end):
+        """Holiday rows (date, name, type) with start <= date <= end."""
+        return self.holidays[bisect.bisect_left(self._dates, start):bisect.bisect_right(self._dates, end)]
+
+    @staticmethod
+    def sundays_between(start, end):
+        first = start + timedelta(days=(6 - start.weekday()) % 7)
+        return [first + timedelta(days=7 * i) for i in range(max(0, (end - first).days // 7 + 1))]
+
+
+class WorkingDayCalendarService:
+    """
+    Hands out the current WorkingDayCalendar, rebuilding it only when the
+    holiday data version reported by `version_getter` changes.
+    """
+
+    def __init__(self, loader, version_getter):
+        self._loader = loader
+        self._version_getter = version_getter
+        self._calendar = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        version = self._version_getter()
+        if self._calendar is None or version != self._version:
+            with self._lock:
+                if self._calendar is None or version != self._version:
+                    self._calendar = WorkingDayCalendar(self._loader())
+                    self._version = version
+        return self._calendar